@@ -6,7 +6,7 @@ from fastapi_cache import FastAPICache
 from starlette.responses import FileResponse
 
 from database.database import get_session
-from files.service import upload_photo, get_photo, upload_video, get_video, upload_file, get_file
+from files.service import upload_photo, get_photo, upload_video, get_video, upload_file, get_file, delete_file
 from jwt_handler import verify_jwt_token, verify_token_and_check_role_all
 from fastapi_cache.decorator import cache
 
@@ -50,6 +50,12 @@ async def videos_upload(request: Request,
 
 
 @router.get("/files/{hash}")
-@cache(expire=31536000)
 async def files_get(hash: str, db=Depends(get_session)):
-    return await get_file(db, hash)
\ No newline at end of file
+    return await get_file(db, hash)
+
+
+@router.delete("/files/{hash}")
+async def files_delete(hash: str,
+                       token: HTTPAuthorizationCredentials = Depends(verify_token_and_check_role_all),
+                       db=Depends(get_session)):
+    return await delete_file(db, hash, token['id'])
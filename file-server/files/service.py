@@ -4,6 +4,7 @@ import os
 import shutil
 
 from fastapi import UploadFile, HTTPException
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from starlette.responses import FileResponse
 
@@ -163,4 +164,23 @@ async def get_file(db: AsyncSession, hash: str):
     file_path = os.path.join("data", "files", hash)
     if os.path.exists(file_path):
         return FileResponse(file_path)
-    raise HTTPException(404, "Файла нет")
\ No newline at end of file
+    raise HTTPException(404, "Файла нет")
+
+
+async def delete_file(db: AsyncSession, hash: str, user_id: int):
+    """
+    Удаляет файл владельца с диска и из БД
+    :param db:
+    :param hash:
+    :param user_id:
+    :return:
+    """
+    file = await db.scalar(select(File).where(File.hash_name == hash, File.user_id == user_id))
+    if file is None:
+        raise HTTPException(404, "Файла нет")
+    file_path = os.path.join("data", "files", hash)
+    if os.path.exists(file_path):
+        os.remove(file_path)
+    await db.delete(file)
+    await db.commit()
+    return SuccessResponse({"file": hash})
@@ -5,7 +5,7 @@ MB = 1024 * 1024
 sizes = {
     "photos": MB * 15,
     "videos": MB * 100,
-    "files": MB * 150
+    "files": MB * 300
 }
 
 
@@ -0,0 +1,203 @@
+"""
+Сквозной бенчмарк загрузки резюме: /resume/upload -> очередь разбора -> парсер -> БД.
+
+Приложение поднимается в этом же процессе (ASGI-транспорт httpx), поэтому видны все запросы
+к БД и память воркеров. Нужно полное окружение приложения: Postgres, Redis, file-server
+и парсер на PARSER_URL — для локального прогона подойдёт заглушка из parser-stub.
+
+    python -m benchmarks.ingest --files 200 --zips 2 --zip-size 500 --concurrency 16
+    python -m benchmarks.ingest --files 200 --json after.json --baseline before.json
+"""
+import argparse
+import asyncio
+import datetime
+import io
+import json
+import os
+import resource
+import time
+import tracemalloc
+import uuid
+import zipfile
+
+import httpx
+from sqlalchemy import event
+
+from database.database import engine, async_session
+from src.jwt_handler import generate_jwt_token
+from src.users.models import User
+from src.resumes import service
+
+TERMINAL = ("stored", "failed")
+
+
+class RoundTrips:
+    """
+    Считает запросы к БД, отправленные за время прогона
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(engine.sync_engine, "before_cursor_execute", self)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(engine.sync_engine, "before_cursor_execute", self)
+
+
+def resumeFile(repeat: int = 0) -> tuple:
+    """
+    Синтетический pdf, уникальный по содержимому, чтобы каждый файл проходил весь путь разбора.
+    repeat > 0 даёт файлы из небольшого набора содержимого — проверка пути дедупликации
+    """
+    name = uuid.uuid4().hex
+    key = name if not repeat else str(uuid.uuid4().int % repeat)
+    content = b"%PDF-1.4\n% bench " + key.encode() + b"\n" + os.urandom(2048) * (not repeat) + b"\n%%EOF\n"
+    return f"{name}.pdf", content
+
+
+def zipFile(size: int, repeat: int = 0) -> tuple:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for _ in range(size):
+            archive.writestr(*resumeFile(repeat))
+    return f"{uuid.uuid4().hex}.zip", buffer.getvalue()
+
+
+def percentile(values: list, p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+async def createUser() -> int:
+    async with async_session() as db:
+        user = User(name="bench", surname="ingest", phone=f"bench-{uuid.uuid4().hex[:12]}", role="recruiter")
+        db.add(user)
+        await db.commit()
+        return user.id
+
+
+async def uploadAndWait(client: httpx.AsyncClient, user_id: int, sender: str, filename: str, content: bytes,
+                        latencies: list, statuses: dict):
+    """
+    Загружает файл и ждёт конечного события по каждому файлу задачи, задержка файла — от начала загрузки
+    """
+    started = time.perf_counter()
+    response = await client.post(f"/resume/upload/{sender}", files={"file": (filename, content)})
+    response.raise_for_status()
+    job_id = response.json()["job_id"]
+    stream = await service.streamJobEvents(user_id, job_id)
+    async for message in stream.body_iterator:
+        if message["event"] in TERMINAL:
+            latencies.append(time.perf_counter() - started)
+        if message["event"] in TERMINAL or message["event"] == "job":
+            key = message["event"] if message["event"] != "job" else "job_" + json.loads(message["data"])["job_status"]
+            statuses[key] = statuses.get(key, 0) + 1
+
+
+async def ingest(client: httpx.AsyncClient, user_id: int, args) -> tuple:
+    """
+    Один прогон: загружает набор файлов и ждёт разбора всех
+    :return: секунды, задержки файлов, счётчики статусов, запросы к БД
+    """
+    uploads = [resumeFile(args.repeat) for _ in range(args.files)] + \
+              [zipFile(args.zip_size, args.repeat) for _ in range(args.zips)]
+    latencies, statuses = [], {}
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one(filename, content):
+        async with semaphore:
+            await uploadAndWait(client, user_id, args.sender, filename, content, latencies, statuses)
+
+    with RoundTrips() as round_trips:
+        started = time.perf_counter()
+        await asyncio.gather(*(one(*upload) for upload in uploads))
+        elapsed = time.perf_counter() - started
+    return elapsed, latencies, statuses, round_trips.count
+
+
+async def run(args) -> dict:
+    import main
+
+    await main.startup()
+    try:
+        # бэкфиллы и загрузка матчера на старте не должны попасть в замер
+        await asyncio.gather(*main.startup_tasks)
+        user_id = await createUser()
+        token = await generate_jwt_token({"id": user_id, "role": "recruiter"}, datetime.timedelta(hours=2))
+        total_files = args.files + args.zips * args.zip_size
+
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None,
+                                     headers={"Authorization": f"Bearer {token}"}) as client:
+            elapsed, latencies, statuses, round_trips = await ingest(client, user_id, args)
+            peak = None
+            if args.memory:
+                # tracemalloc замедляет каждую аллокацию, поэтому память меряем отдельным прогоном без замера времени
+                tracemalloc.start()
+                await ingest(client, user_id, args)
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+    finally:
+        await main.shutdown()
+
+    stored = statuses.get("stored", 0)
+    return {
+        "files": total_files,
+        "stored": stored,
+        "failed": statuses.get("failed", 0),
+        "seconds": round(elapsed, 3),
+        "files_per_sec": round(total_files / elapsed, 2),
+        "p50": round(percentile(latencies, 50), 3),
+        "p95": round(percentile(latencies, 95), 3),
+        "p99": round(percentile(latencies, 99), 3),
+        "db_round_trips": round_trips,
+        "db_round_trips_per_resume": round(round_trips / stored, 1) if stored else None,
+        "peak_traced_mb": round(peak / 2 ** 20, 1) if peak is not None else None,
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def report(result: dict, baseline: dict = None):
+    for key, value in result.items():
+        line = f"{key:>26}: {value}"
+        previous = (baseline or {}).get(key)
+        if isinstance(value, (int, float)) and isinstance(previous, (int, float)) and previous:
+            line += f"  (было {previous}, {(value - previous) / previous:+.1%})"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк загрузки и разбора резюме")
+    parser.add_argument("--files", type=int, default=100, help="одиночных файлов")
+    parser.add_argument("--zips", type=int, default=0, help="архивов")
+    parser.add_argument("--zip-size", type=int, default=500, help="файлов в архиве")
+    parser.add_argument("--concurrency", type=int, default=16, help="одновременных загрузок")
+    parser.add_argument("--repeat", type=int, default=0, help="различных содержимых, 0 — все файлы уникальны")
+    parser.add_argument("--sender", default="bench")
+    parser.add_argument("--no-memory", dest="memory", action="store_false",
+                        help="без второго прогона под tracemalloc для пиковой памяти")
+    parser.add_argument("--json", help="сохранить результат в файл")
+    parser.add_argument("--baseline", help="сравнить с сохранённым результатом")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    report(result, baseline)
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(result, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,12 @@
 import os
 
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
 
+from database.migrations import migrate
+
 load_dotenv()
 
 DATABASE_URL = os.getenv('DATABASE_URL_LOCAL')
@@ -26,4 +28,7 @@ async def get_session() -> AsyncSession:
 async def init_models():
     async with engine.begin() as conn:
         #await conn.run_sync(Base.metadata.drop_all)
+        # триграммный индекс поиска резюме
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
         await conn.run_sync(Base.metadata.create_all)
+        await migrate(conn)
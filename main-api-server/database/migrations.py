@@ -0,0 +1,86 @@
+from sqlalchemy import text
+
+# create_all создаёт только недостающие таблицы и не меняет существующие, поэтому новые колонки,
+# индексы и ограничения существующих таблиц добавляются здесь. Каждая команда идемпотентна
+# и выполняется на каждом старте после create_all
+MIGRATIONS = [
+    # дедупликация загрузок по хешу содержимого
+    "ALTER TABLE inputs ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64)",
+    "CREATE INDEX IF NOT EXISTS ix_inputs_content_hash ON inputs (content_hash)",
+    "ALTER TABLE upload_jobs ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64)",
+    # временный файл загрузки задачи
+    "ALTER TABLE upload_jobs ADD COLUMN IF NOT EXISTS file_path VARCHAR",
+    # постраничный список резюме по курсору
+    "CREATE INDEX IF NOT EXISTS ix_inputs_user_id_id ON inputs (user_id, id)",
+    "CREATE INDEX IF NOT EXISTS ix_resumes_data_resume_id_id ON resumes_data (resume_id, id)",
+    # полнотекстовый поиск
+    "ALTER TABLE resumes_data ADD COLUMN IF NOT EXISTS search_title TEXT",
+    "ALTER TABLE resumes_data ADD COLUMN IF NOT EXISTS search_text TEXT",
+    "ALTER TABLE resumes_data ADD COLUMN IF NOT EXISTS search_vector TSVECTOR GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('russian', coalesce(search_title, '')), 'A') || "
+    "setweight(to_tsvector('russian', coalesce(search_text, '')), 'B')) STORED",
+    "CREATE INDEX IF NOT EXISTS ix_resumes_data_search_vector ON resumes_data USING gin (search_vector)",
+    "CREATE INDEX IF NOT EXISTS ix_resumes_data_search_title_trgm ON resumes_data "
+    "USING gin (search_title gin_trgm_ops)",
+    # избранное: без дублей, постранично по курсору
+    "DO $$ BEGIN "
+    "IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'uq_favorites_user_id_resume_id') THEN "
+    "DELETE FROM favorites f USING favorites o "
+    "WHERE f.user_id = o.user_id AND f.resume_id = o.resume_id AND f.id > o.id; "
+    "ALTER TABLE favorites ADD CONSTRAINT uq_favorites_user_id_resume_id UNIQUE (user_id, resume_id); "
+    "END IF; END $$",
+    "CREATE INDEX IF NOT EXISTS ix_favorites_user_id_id ON favorites (user_id, id)",
+    # нормализованные контакты и кластеры кандидатов
+    "ALTER TABLE resumes_data ADD COLUMN IF NOT EXISTS email_key VARCHAR",
+    "ALTER TABLE resumes_data ADD COLUMN IF NOT EXISTS phone_key VARCHAR",
+    "ALTER TABLE resumes_data ADD COLUMN IF NOT EXISTS telegram_key VARCHAR",
+    "ALTER TABLE resumes_data ADD COLUMN IF NOT EXISTS candidate_id INTEGER",
+    "CREATE INDEX IF NOT EXISTS ix_resumes_data_email_key ON resumes_data (email_key)",
+    "CREATE INDEX IF NOT EXISTS ix_resumes_data_phone_key ON resumes_data (phone_key)",
+    "CREATE INDEX IF NOT EXISTS ix_resumes_data_telegram_key ON resumes_data (telegram_key)",
+    "CREATE INDEX IF NOT EXISTS ix_resumes_data_candidate_id ON resumes_data (candidate_id)",
+    # удалённые резюме, которые ждут очистки
+    "CREATE INDEX IF NOT EXISTS ix_resumes_data_disabled_id ON resumes_data (id) WHERE disabled",
+    # оригинал задачи в file-server
+    "ALTER TABLE upload_jobs ADD COLUMN IF NOT EXISTS file_link VARCHAR",
+    # ссылки на словарь терминов
+    "ALTER TABLE stack ADD COLUMN IF NOT EXISTS term_id INTEGER REFERENCES terms (id)",
+    "ALTER TABLE skills ADD COLUMN IF NOT EXISTS term_id INTEGER REFERENCES terms (id)",
+    "ALTER TABLE templates_skills ADD COLUMN IF NOT EXISTS term_id INTEGER REFERENCES terms (id)",
+    "ALTER TABLE template_stacks ADD COLUMN IF NOT EXISTS term_id INTEGER REFERENCES terms (id)",
+    "CREATE INDEX IF NOT EXISTS ix_stack_term_id_resume_id ON stack (term_id, resume_id)",
+    "CREATE INDEX IF NOT EXISTS ix_skills_term_id_resume_id ON skills (term_id, resume_id)",
+    "CREATE INDEX IF NOT EXISTS ix_templates_skills_term_id ON templates_skills (term_id)",
+    "CREATE INDEX IF NOT EXISTS ix_template_stacks_term_id ON template_stacks (term_id)",
+    # стаж и год рождения числами
+    "ALTER TABLE resumes_data ADD COLUMN IF NOT EXISTS experience_months INTEGER",
+    "ALTER TABLE resumes_data ADD COLUMN IF NOT EXISTS birth_year INTEGER",
+    "CREATE INDEX IF NOT EXISTS ix_resumes_data_experience_months ON resumes_data (experience_months)",
+    "CREATE INDEX IF NOT EXISTS ix_resumes_data_birth_year ON resumes_data (birth_year)",
+    # аренда задачи разбора репликой
+    "ALTER TABLE upload_jobs ADD COLUMN IF NOT EXISTS owner VARCHAR",
+    "ALTER TABLE upload_jobs ADD COLUMN IF NOT EXISTS lease_until TIMESTAMP WITHOUT TIME ZONE",
+    "CREATE INDEX IF NOT EXISTS ix_upload_jobs_unfinished_lease_until ON upload_jobs (lease_until) "
+    "WHERE status IN ('queued', 'processing')",
+    # оригиналы в file-server, на которые ещё ссылаются резюме
+    "CREATE INDEX IF NOT EXISTS ix_inputs_link ON inputs (link)",
+    # отметка о записанных фасетах; резюме, у которых фасеты уже есть, отмечаются один раз при добавлении колонки
+    "DO $$ BEGIN "
+    "IF NOT EXISTS (SELECT 1 FROM information_schema.columns "
+    "WHERE table_name = 'resumes_data' AND column_name = 'facets_indexed') THEN "
+    "ALTER TABLE resumes_data ADD COLUMN facets_indexed BOOLEAN NOT NULL DEFAULT false; "
+    "UPDATE resumes_data r SET facets_indexed = true "
+    "WHERE EXISTS (SELECT 1 FROM resume_facets f WHERE f.resume_id = r.id); "
+    "END IF; END $$",
+    "CREATE INDEX IF NOT EXISTS ix_resumes_data_facets_pending_id ON resumes_data (id) WHERE NOT facets_indexed",
+]
+
+
+async def migrate(conn):
+    """
+    Доводит схему существующей БД до моделей
+    :param conn:
+    :return:
+    """
+    for statement in MIGRATIONS:
+        await conn.execute(text(statement))
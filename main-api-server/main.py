@@ -1,16 +1,29 @@
-import aioredis
+import asyncio
+
 import uvicorn
 from fastapi import FastAPI, HTTPException
 from fastapi.openapi.docs import get_swagger_ui_html, get_swagger_ui_oauth2_redirect_html
-from fastapi_cache import FastAPICache
-from fastapi_cache.backends.redis import RedisBackend
 from starlette.middleware.cors import CORSMiddleware
 from starlette.requests import Request
 from starlette.responses import JSONResponse
 
 from database.database import init_models
+from redis_creator.redis_creator import redis as redis_client
+from src.parser.client import parser_client
+from src.resumes.contacts import backfillContactKeys
+from src.resumes.counters import reconcileResumeCountsPeriodically
+from src.resumes.events import job_events
+from src.resumes.limits import UploadSizeLimitMiddleware
+from src.resumes.numeric import backfillNumericColumns
+from src.resumes.purge import resume_purger
 from src.resumes.router import resumes_router
+from src.resumes.service import parse_queue, requeuePendingJobsPeriodically
+from src.search.router import search_router
+from src.storage.client import file_storage
+from src.search.service import backfillSearchIndex, backfillFacets
+from src.templates.matcher import resume_matcher
 from src.templates.router import templates_router
+from src.terms.service import term_dictionary, backfillTermIds
 from src.users.router import users_router, scores_router
 
 #from redis_creator.redis_creator import redis
@@ -33,8 +46,15 @@ app.include_router(users_router)
 app.include_router(scores_router)
 app.include_router(resumes_router)
 app.include_router(templates_router)
+app.include_router(search_router)
+
+# разовые фоновые задачи старта: бэкфиллы и загрузка матчера
+startup_tasks = []
+# постоянные фоновые задачи приложения
+background_tasks = []
 
 
+app.add_middleware(UploadSizeLimitMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -52,11 +72,42 @@ async def unicorn_exception_handler(request: Request, exc: HTTPException):
     )
 
 
+async def loadMatcher(*backfills):
+    # матчер читает term_id и стаж в месяцах, поэтому грузится после их бэкфилла
+    await asyncio.wait(backfills)
+    await resume_matcher.load()
+
+
 @app.on_event("startup")
 async def startup():
     await init_models()
-    redis = await aioredis.create_redis_pool('redis://79.174.80.94')
-    FastAPICache.init(RedisBackend(redis), prefix="fastapi-cache")
+    await term_dictionary.load()
+    await parser_client.start()
+    await file_storage.start()
+    await parse_queue.start()
+    startup_tasks.append(asyncio.create_task(backfillSearchIndex()))
+    startup_tasks.append(asyncio.create_task(backfillFacets()))
+    term_backfill = asyncio.create_task(backfillTermIds())
+    numeric_backfill = asyncio.create_task(backfillNumericColumns())
+    startup_tasks.extend([term_backfill, numeric_backfill])
+    startup_tasks.append(asyncio.create_task(loadMatcher(term_backfill, numeric_backfill)))
+    startup_tasks.append(asyncio.create_task(backfillContactKeys()))
+    background_tasks.append(asyncio.create_task(job_events.listen()))
+    background_tasks.append(asyncio.create_task(resume_matcher.listen()))
+    background_tasks.append(asyncio.create_task(requeuePendingJobsPeriodically()))
+    background_tasks.append(asyncio.create_task(reconcileResumeCountsPeriodically()))
+    background_tasks.append(asyncio.create_task(resume_purger.runPeriodically()))
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    for task in startup_tasks + background_tasks:
+        task.cancel()
+    await asyncio.gather(*startup_tasks, *background_tasks, return_exceptions=True)
+    await parse_queue.stop()
+    await parser_client.close()
+    await file_storage.close()
+    await redis_client.close()
 
 
 @app.get("/docs", include_in_schema=False)
@@ -0,0 +1,11 @@
+import os
+
+from dotenv import load_dotenv
+from redis import asyncio as aioredis
+
+load_dotenv()
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://79.174.80.94")
+
+# клиент лениво подключается при первом запросе, пул соединений общий на приложение
+redis = aioredis.from_url(REDIS_URL)
@@ -41,8 +41,10 @@ class AbstractModel(Base):
     disabled = Column(Boolean, server_default='false')
 
     async def to_dict(self, **kwargs):
+        # колонки, не загруженные запросом (load_only), не сериализуем, чтобы не ходить за ними в БД
+        state = inspect(self)
         data = {column.key: getattr(self, column.key)
-                for column in inspect(self).mapper.column_attrs}
+                for column in state.mapper.column_attrs if column.key not in state.unloaded}
         for key, value in data.items():
             if isinstance(value, datetime):
                 data[key] = value.isoformat()
@@ -60,7 +62,7 @@ class AbstractModel(Base):
                     raise HTTPException(403, "Неожиданная ошибка, связь не уловили")
 
         for attr in self.hidden:
-            data.pop(attr)
+            data.pop(attr, None)
 
         return data
 
@@ -3,12 +3,13 @@ import os
 import time
 from typing import Optional
 
-from fastapi import HTTPException, Depends
+from fastapi import HTTPException, Depends, Query
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from jose import jwt
 from sqlalchemy import select, delete
 from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
+from starlette.requests import Request
 
 #from AbstractModel import query_fetchone
 
@@ -18,6 +19,8 @@ SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = "HS256"
 
 security = HTTPBearer()
+# для EventSource, который не умеет передавать заголовки: токен берётся из ?token= или cookie
+optional_security = HTTPBearer(auto_error=False)
 
 
 async def generate_jwt_token(payload: dict, expires_delta: Optional[datetime.timedelta] = None) -> str:
@@ -143,6 +146,24 @@ async def verify_token_and_check_role_hiring_manager_and_recruiter(token: HTTPAu
     return decoded_token
 
 
+async def verify_token_or_query_and_check_role_hiring_manager_and_recruiter(
+        request: Request, token: Optional[str] = Query(None, description="access_token, если нельзя передать заголовок"),
+        credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)):
+    """
+    Проверяет роль нанимающего менеджера или рекрутера, токен ищет в заголовке, в ?token= или в cookie access_token
+    :param request:
+    :param token:
+    :param credentials:
+    :return:
+    """
+    if credentials is None:
+        token = token or request.cookies.get("access_token")
+        if not token:
+            raise HTTPException(403, "Not authenticated")
+        credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+    return await verify_token_and_check_role_hiring_manager_and_recruiter(credentials)
+
+
 async def verify_token_and_check_role_hiring_manager_and_resource_manager(token: HTTPAuthorizationCredentials = Depends(security)):
     """
     Проверяет роль нанимающего менеджера или рекрутера
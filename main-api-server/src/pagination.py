@@ -0,0 +1,30 @@
+import base64
+import json
+
+from fastapi import HTTPException
+
+
+def encode_cursor(**values) -> str:
+    """
+    Упаковывает позицию последней записи страницы в непрозрачный курсор
+    :param values:
+    :return:
+    """
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> dict:
+    """
+    Распаковывает курсор, полученный от клиента
+    :param cursor:
+    :return:
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        raise HTTPException(400, "Неверный курсор")
+    if not isinstance(values, dict):
+        raise HTTPException(400, "Неверный курсор")
+    return values
@@ -0,0 +1,97 @@
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+
+from redis.exceptions import RedisError
+
+from redis_creator.redis_creator import redis
+
+logger = logging.getLogger(__name__)
+
+PARSER_CACHE_SIZE = int(os.getenv("PARSER_CACHE_SIZE", 1000))
+PARSER_CACHE_TTL = int(os.getenv("PARSER_CACHE_TTL", 60 * 60))
+PARSER_CACHE_REDIS_TTL = int(os.getenv("PARSER_CACHE_REDIS_TTL", 60 * 60 * 24 * 30))
+
+
+class ParserCache:
+    """
+    Кеш ответов парсера по sha256 документа.
+    Первый уровень — LRU в памяти процесса, второй — общий Redis, у обоих свой TTL
+    """
+
+    prefix = "parser-cache:"
+
+    def __init__(self, redis_client=redis, max_size: int = PARSER_CACHE_SIZE,
+                 ttl: int = PARSER_CACHE_TTL, redis_ttl: int = PARSER_CACHE_REDIS_TTL):
+        self.redis = redis_client
+        self.max_size = max_size
+        self.ttl = ttl
+        self.redis_ttl = redis_ttl
+        self.local = OrderedDict()
+        self.memory_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    def _remember(self, content_hash: str, value: dict):
+        self.local[content_hash] = (time.monotonic() + self.ttl, value)
+        self.local.move_to_end(content_hash)
+        while len(self.local) > self.max_size:
+            self.local.popitem(last=False)
+
+    async def get(self, content_hash: str):
+        """
+        Ищет ответ парсера сначала в памяти, потом в Redis
+        :param content_hash:
+        :return: ответ парсера или None
+        """
+        entry = self.local.get(content_hash)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self.local.move_to_end(content_hash)
+                self.memory_hits += 1
+                return value
+            del self.local[content_hash]
+
+        try:
+            raw = await self.redis.get(self.prefix + content_hash)
+        except RedisError:
+            logger.warning("Redis недоступен, кеш парсера работает только в памяти")
+            raw = None
+        if raw is not None:
+            value = json.loads(raw)
+            self._remember(content_hash, value)
+            self.redis_hits += 1
+            return value
+
+        self.misses += 1
+        return None
+
+    async def set(self, content_hash: str, value: dict):
+        """
+        Сохраняет ответ парсера на оба уровня
+        :param content_hash:
+        :param value:
+        :return:
+        """
+        self._remember(content_hash, value)
+        try:
+            await self.redis.set(self.prefix + content_hash, json.dumps(value, ensure_ascii=False),
+                                 ex=self.redis_ttl)
+        except RedisError:
+            logger.warning("Redis недоступен, ответ парсера сохранён только в памяти")
+
+    def stats(self) -> dict:
+        requests = self.memory_hits + self.redis_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.redis_hits) / requests, 4) if requests else 0,
+            "memory_size": len(self.local),
+        }
+
+
+parser_cache = ParserCache()
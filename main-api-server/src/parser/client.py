@@ -0,0 +1,80 @@
+import asyncio
+import os
+
+import httpx
+from dotenv import load_dotenv
+from fastapi import HTTPException
+
+load_dotenv()
+
+PARSER_URL = os.getenv("PARSER_URL", "http://192.168.137.103:8080/resume/scrab")
+PARSER_TIMEOUT = float(os.getenv("PARSER_TIMEOUT", 120))
+PARSER_CONNECT_TIMEOUT = float(os.getenv("PARSER_CONNECT_TIMEOUT", 5))
+PARSER_CONCURRENCY = int(os.getenv("PARSER_CONCURRENCY", 8))
+PARSER_RETRIES = int(os.getenv("PARSER_RETRIES", 3))
+PARSER_BACKOFF = float(os.getenv("PARSER_BACKOFF", 0.5))
+
+
+class ParserClient:
+    """
+    Асинхронный клиент парсера резюме.
+    Держит пул keep-alive соединений, ограничивает число одновременных запросов к парсеру
+    и повторяет запрос с экспоненциальной задержкой при сетевых ошибках и 5xx
+    """
+
+    def __init__(self, url: str = PARSER_URL, timeout: float = PARSER_TIMEOUT,
+                 concurrency: int = PARSER_CONCURRENCY, retries: int = PARSER_RETRIES,
+                 backoff: float = PARSER_BACKOFF):
+        self.url = url
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.client = None
+        self.semaphore = None
+
+    async def start(self):
+        """
+        Создаёт пул соединений, вызывается один раз на старте приложения
+        :return:
+        """
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(self.timeout, connect=PARSER_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency),
+        )
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    async def parse(self, filename: str, content: bytes) -> dict:
+        """
+        Отправляет файл в парсер и возвращает его ответ
+        :param filename:
+        :param content:
+        :return:
+        """
+        if self.client is None:
+            raise HTTPException(503, "Клиент парсера не запущен")
+        error = None
+        for attempt in range(self.retries + 1):
+            try:
+                async with self.semaphore:
+                    response = await self.client.post(self.url, files={"file": (filename, content)})
+                if response.status_code == 200:
+                    return response.json()
+                error = HTTPException(status_code=response.status_code, detail=response.text)
+                if response.status_code < 500:
+                    raise error
+            except httpx.TimeoutException as e:
+                error = HTTPException(504, f"Парсер не ответил вовремя: {str(e)}")
+            except httpx.TransportError as e:
+                error = HTTPException(502, f"Парсер недоступен: {str(e)}")
+            if attempt < self.retries:
+                await asyncio.sleep(self.backoff * 2 ** attempt)
+        raise error
+
+
+parser_client = ParserClient()
@@ -0,0 +1,94 @@
+import logging
+import os
+
+from redis.exceptions import RedisError, WatchError
+
+from redis_creator.redis_creator import redis
+
+logger = logging.getLogger(__name__)
+
+RESUME_CACHE_TTL = int(os.getenv("RESUME_CACHE_TTL", 60 * 100))
+
+
+class ResumeCache:
+    """
+    Кеш готовых JSON-ответов getById.
+    На каждое резюме один hash в Redis, поле — пользователь и набор fields/include,
+    поэтому сброс резюме — один DEL.
+    Рядом лежит поколение резюме: сброс его увеличивает, а ответ, прочитанный из БД до сброса,
+    записывается, только если поколение не изменилось, — иначе устаревший ответ пережил бы сброс до TTL
+    """
+
+    prefix = "resume:"
+    generation_prefix = "resume-generation:"
+
+    def __init__(self, redis_client=redis, ttl: int = RESUME_CACHE_TTL):
+        self.redis = redis_client
+        self.ttl = ttl
+
+    @staticmethod
+    def field(user_id: int, projection: str) -> str:
+        return f"{user_id}:{projection}"
+
+    async def get(self, user_id: int, resume_id: int, projection: str = "") -> tuple:
+        """
+        Отдаёт сохранённый ответ и текущее поколение резюме, которое нужно передать в set
+        :param user_id:
+        :param resume_id:
+        :param projection:
+        :return: (bytes или None, поколение)
+        """
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                body, generation = await (pipe.hget(self.prefix + str(resume_id), self.field(user_id, projection))
+                                          .get(self.generation_prefix + str(resume_id)).execute())
+            return body, generation or b"0"
+        except RedisError:
+            logger.warning("Redis недоступен, резюме читается из БД")
+            return None, None
+
+    async def set(self, user_id: int, resume_id: int, body: bytes, generation: bytes, projection: str = ""):
+        """
+        Сохраняет ответ, если резюме не сбрасывали после чтения поколения в get
+        :param user_id:
+        :param resume_id:
+        :param body:
+        :param generation:
+        :param projection:
+        :return:
+        """
+        if generation is None:
+            return
+        key, generation_key = self.prefix + str(resume_id), self.generation_prefix + str(resume_id)
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                await pipe.watch(generation_key)
+                if (await pipe.get(generation_key) or b"0") != generation:
+                    return
+                pipe.multi()
+                await pipe.hset(key, self.field(user_id, projection), body).expire(key, self.ttl).execute()
+        except WatchError:
+            pass
+        except RedisError:
+            logger.warning("Redis недоступен, резюме не закешировано")
+
+    async def invalidate(self, *resume_ids: int):
+        """
+        Сбрасывает кеш резюме, вызывается при удалении резюме и изменении его дочерних записей
+        :param resume_ids:
+        :return:
+        """
+        if not resume_ids:
+            return
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                for resume_id in resume_ids:
+                    generation_key = self.generation_prefix + str(resume_id)
+                    # поколение живёт дольше любого ответа в кеше
+                    pipe.incr(generation_key).expire(generation_key, self.ttl * 2)
+                await pipe.delete(*[self.prefix + str(resume_id) for resume_id in resume_ids]).execute()
+        except RedisError:
+            logger.warning("Redis недоступен, кеш резюме %s не сброшен", resume_ids)
+
+
+resume_cache = ResumeCache()
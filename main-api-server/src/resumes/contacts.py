@@ -0,0 +1,126 @@
+import asyncio
+import logging
+import os
+import re
+
+from sqlalchemy import select, update, func, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.database import async_session
+from src.resumes.models import ResumeData, InputResume
+
+logger = logging.getLogger(__name__)
+
+CONTACTS_BACKFILL_BATCH = int(os.getenv("CONTACTS_BACKFILL_BATCH", 1000))
+GMAIL_DOMAINS = ("gmail.com", "googlemail.com")
+TELEGRAM_PREFIXES = ("https://t.me/", "http://t.me/", "t.me/", "@")
+
+
+def normalizeEmail(email: str):
+    """I.Petrov+hh@Mail.ru -> i.petrov@mail.ru, точки в gmail не учитываются"""
+    email = (email or "").strip().lower()
+    if email.count("@") != 1:
+        return None
+    local, domain = email.split("@")
+    local = local.split("+")[0]
+    if domain in GMAIL_DOMAINS:
+        local, domain = local.replace(".", ""), "gmail.com"
+    return f"{local}@{domain}" if local and domain else None
+
+
+def normalizePhone(phone: str):
+    """+7 (978) 123-45-67, 8 978 123 45 67, 9781234567 -> 79781234567"""
+    digits = re.sub(r"\D", "", phone or "")
+    if len(digits) == 11 and digits[0] == "8":
+        digits = "7" + digits[1:]
+    elif len(digits) == 10:
+        digits = "7" + digits
+    return digits if len(digits) >= 11 else None
+
+
+def normalizeTelegram(telegram: str):
+    """@Ivan, t.me/ivan, https://t.me/ivan -> ivan"""
+    telegram = (telegram or "").strip().lower()
+    for prefix in TELEGRAM_PREFIXES:
+        if telegram.startswith(prefix):
+            telegram = telegram[len(prefix):]
+    telegram = telegram.strip("/")
+    return telegram if re.fullmatch(r"[a-z0-9_]{3,32}", telegram) else None
+
+
+def contactKeys(email: str, phone_number: str, telegram: str) -> dict:
+    return {"email_key": normalizeEmail(email), "phone_key": normalizePhone(phone_number),
+            "telegram_key": normalizeTelegram(telegram)}
+
+
+def candidateKey():
+    """Ключ кластера резюме: candidate_id, а у первого резюме кластера — его id"""
+    return func.coalesce(ResumeData.candidate_id, ResumeData.id)
+
+
+async def linkCandidate(db: AsyncSession, keys: dict, user_id: int, resume_id: int = None):
+    """
+    Находит кластер резюме с теми же контактами — по индексам, равенством по каждому ключу.
+    Кластеры ищутся только среди не удалённых резюме того же владельца.
+    Если контакты совпали с несколькими кластерами, они сливаются в кластер с меньшим id.
+    Без commit — выполняется в транзакции сохранения резюме
+    :param db:
+    :param keys: нормализованные контакты, см. contactKeys
+    :param user_id: владелец резюме
+    :param resume_id: само резюме, если оно уже сохранено
+    :return: candidate_id для резюме или None, если совпадений нет
+    """
+    conditions = [getattr(ResumeData, key) == value for key, value in keys.items() if value]
+    if not conditions:
+        return None
+    owned = ResumeData.resume_id.in_(select(InputResume.id).where(InputResume.user_id == user_id))
+    query = select(candidateKey()).where(or_(*conditions), owned, ResumeData.disabled.is_(False)).distinct()
+    if resume_id is not None:
+        query = query.where(ResumeData.id != resume_id)
+    clusters = sorted((await db.scalars(query)).all())
+    if not clusters:
+        return None
+    candidate_id, merged = clusters[0], clusters[1:]
+    if merged:
+        await db.execute(update(ResumeData)
+                         .where(or_(ResumeData.candidate_id.in_(merged), ResumeData.id.in_(merged)),
+                                owned, ResumeData.disabled.is_(False))
+                         .values(candidate_id=candidate_id))
+    return candidate_id
+
+
+async def backfillContactKeys(batch_size: int = CONTACTS_BACKFILL_BATCH):
+    """
+    Заполняет нормализованные контакты и кластеры у резюме, сохранённых до их появления
+    :param batch_size:
+    :return: сколько резюме обработано
+    """
+    total = 0
+    last_id = 0
+    while True:
+        async with async_session() as db:
+            rows = (await db.execute(select(ResumeData.id, ResumeData.email, ResumeData.phone_number,
+                                            ResumeData.telegram, InputResume.user_id)
+                                     .join(InputResume, InputResume.id == ResumeData.resume_id)
+                                     .where(ResumeData.id > last_id,
+                                            ResumeData.email_key.is_(None), ResumeData.phone_key.is_(None),
+                                            ResumeData.telegram_key.is_(None),
+                                            or_(ResumeData.email.isnot(None), ResumeData.phone_number.isnot(None),
+                                                ResumeData.telegram.isnot(None)))
+                                     .order_by(ResumeData.id).limit(batch_size))).all()
+            if not rows:
+                break
+            for resume_id, email, phone_number, telegram, user_id in rows:
+                keys = contactKeys(email, phone_number, telegram)
+                if not any(keys.values()):
+                    continue
+                candidate_id = await linkCandidate(db, keys, user_id, resume_id)
+                await db.execute(update(ResumeData).where(ResumeData.id == resume_id)
+                                 .values(candidate_id=candidate_id, **keys))
+            await db.commit()
+            last_id = rows[-1][0]
+            total += len(rows)
+        await asyncio.sleep(0)
+    if total:
+        logger.info("Контакты нормализованы для %s резюме", total)
+    return total
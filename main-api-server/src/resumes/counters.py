@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import os
+from collections import Counter
+
+from sqlalchemy import select, func, update, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.database import async_session
+from src.resumes.models import ResumeCount, ResumeData, InputResume
+
+logger = logging.getLogger(__name__)
+
+RESUME_COUNTS_RECONCILE_INTERVAL = int(os.getenv("RESUME_COUNTS_RECONCILE_INTERVAL", 3600))
+
+
+def countKeys(user_id: int, sender: str):
+    """Счётчики, в которые входит резюме пользователя из этого источника"""
+    return [("all", ""), ("user", str(user_id)), ("sender", sender or "")]
+
+
+async def changeResumeCounts(db: AsyncSession, resumes: list, delta: int):
+    """
+    Увеличивает или уменьшает счётчики резюме. Без commit — выполняется в транзакции
+    сохранения или удаления резюме
+    :param db:
+    :param resumes: [(user_id, sender)]
+    :param delta: 1 при сохранении, -1 при удалении
+    :return:
+    """
+    counts = Counter(key for user_id, sender in resumes for key in countKeys(user_id, sender))
+    if not counts:
+        return
+    statement = pg_insert(ResumeCount).values([{"scope": scope, "key": key, "count": count * delta}
+                                               for (scope, key), count in counts.items()])
+    await db.execute(statement.on_conflict_do_update(constraint="uq_resume_counts_scope_key",
+                                                     set_={"count": ResumeCount.count + statement.excluded.count}))
+
+
+async def getResumeCount(db: AsyncSession, scope: str, key: str = "") -> int:
+    """
+    Значение одного счётчика, одна строка по уникальному индексу
+    :param db:
+    :param scope:
+    :param key:
+    :return:
+    """
+    count = await db.scalar(select(ResumeCount.count).where(ResumeCount.scope == scope, ResumeCount.key == key))
+    return count or 0
+
+
+async def getResumeCounts(db: AsyncSession, scope: str) -> dict:
+    """
+    Все ненулевые счётчики одного вида
+    :param db:
+    :param scope:
+    :return: {key: count}
+    """
+    rows = await db.execute(select(ResumeCount.key, ResumeCount.count)
+                            .where(ResumeCount.scope == scope, ResumeCount.count > 0)
+                            .order_by(ResumeCount.count.desc()))
+    return dict(rows.all())
+
+
+async def reconcileResumeCounts():
+    """
+    Пересчитывает счётчики по таблицам резюме и исправляет разошедшиеся
+    :return: сколько счётчиков исправлено
+    """
+    async with async_session() as db:
+        joined = (select(InputResume.user_id, InputResume.sender)
+                  .join(ResumeData, ResumeData.resume_id == InputResume.id).where(ResumeData.disabled.is_(False)))
+        real = {("all", ""): await db.scalar(select(func.count()).select_from(joined.subquery()))}
+        for scope, column in (("user", InputResume.user_id), ("sender", InputResume.sender)):
+            rows = await db.execute(select(column, func.count())
+                                    .join(ResumeData, ResumeData.resume_id == InputResume.id)
+                                    .where(ResumeData.disabled.is_(False))
+                                    .group_by(column))
+            for key, count in rows.all():
+                real[(scope, "" if key is None else str(key))] = count
+        stored = dict(((scope, key), count) for scope, key, count in
+                      (await db.execute(select(ResumeCount.scope, ResumeCount.key, ResumeCount.count))).all())
+        fixed = {key: count for key, count in real.items() if stored.get(key) != count}
+        stale = [key for key, count in stored.items() if key not in real and count != 0]
+        if fixed:
+            statement = pg_insert(ResumeCount).values([{"scope": scope, "key": key, "count": count}
+                                                       for (scope, key), count in fixed.items()])
+            await db.execute(statement.on_conflict_do_update(constraint="uq_resume_counts_scope_key",
+                                                             set_={"count": statement.excluded.count}))
+        if stale:
+            await db.execute(update(ResumeCount).where(tuple_(ResumeCount.scope, ResumeCount.key).in_(stale))
+                             .values(count=0))
+        await db.commit()
+    if fixed or stale:
+        logger.info("Исправлено счётчиков резюме: %s", len(fixed) + len(stale))
+    return len(fixed) + len(stale)
+
+
+async def reconcileResumeCountsPeriodically(interval: int = RESUME_COUNTS_RECONCILE_INTERVAL):
+    """
+    Сверяет счётчики на старте и затем раз в interval секунд
+    :param interval:
+    :return:
+    """
+    while True:
+        try:
+            await reconcileResumeCounts()
+        except Exception:
+            logger.exception("Не удалось сверить счётчики резюме")
+        await asyncio.sleep(interval)
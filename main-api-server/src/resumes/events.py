@@ -0,0 +1,97 @@
+import asyncio
+import json
+import logging
+import os
+from collections import defaultdict
+
+from redis.exceptions import RedisError
+
+from redis_creator.redis_creator import redis
+
+logger = logging.getLogger(__name__)
+
+# события файла задачи: queued -> parsing -> parsed -> stored | failed
+FILE_EVENTS = ("queued", "parsing", "parsed", "failed", "stored")
+JOB_FINISHED = ("done", "failed")
+
+JOB_EVENTS_RECONNECT_DELAY = int(os.getenv("JOB_EVENTS_RECONNECT_DELAY", 5))
+# как часто SSE-поток без событий сверяет статус задачи с БД
+JOB_EVENTS_POLL_INTERVAL = int(os.getenv("JOB_EVENTS_POLL_INTERVAL", 15))
+
+
+class JobEvents:
+    """
+    Рассылка событий разбора подписчикам задачи.
+    Задачу может разбирать любая реплика, а SSE-поток держит другая, поэтому события идут
+    через pub/sub Redis: каждая реплика слушает общий канал и раздаёт события своим подписчикам.
+    Без Redis события доходят только до подписчиков этого процесса
+    """
+
+    channel_prefix = "job-events:"
+
+    def __init__(self, redis_client=redis):
+        self.redis = redis_client
+        self.subscribers = defaultdict(set)
+
+    def subscribe(self, job_id: int) -> asyncio.Queue:
+        queue = asyncio.Queue()
+        self.subscribers[job_id].add(queue)
+        return queue
+
+    def unsubscribe(self, job_id: int, queue: asyncio.Queue):
+        subscribers = self.subscribers.get(job_id)
+        if subscribers is None:
+            return
+        subscribers.discard(queue)
+        if not subscribers:
+            del self.subscribers[job_id]
+
+    async def publish(self, job_id: int, event: str, data: dict):
+        """
+        Публикует событие задачи в Redis, при недоступном Redis отдаёт его подписчикам процесса
+        :param job_id:
+        :param event: статус файла из FILE_EVENTS или job для статуса задачи
+        :param data:
+        :return:
+        """
+        message = {"event": event, "data": json.dumps(data, ensure_ascii=False)}
+        try:
+            await self.redis.publish(self.channel_prefix + str(job_id), json.dumps(message, ensure_ascii=False))
+        except RedisError:
+            logger.warning("Redis недоступен, событие задачи %s разослано только внутри процесса", job_id)
+            self._deliver(job_id, message)
+
+    def _deliver(self, job_id: int, message: dict):
+        for queue in self.subscribers.get(job_id, ()):
+            queue.put_nowait(message)
+
+    async def listen(self):
+        """
+        Слушает события всех задач из Redis и раздаёт их подписчикам процесса,
+        при обрыве соединения переподключается
+        :return:
+        """
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.psubscribe(self.channel_prefix + "*")
+                async for message in pubsub.listen():
+                    if message["type"] != "pmessage":
+                        continue
+                    job_id = int(message["channel"].decode()[len(self.channel_prefix):])
+                    if job_id in self.subscribers:
+                        self._deliver(job_id, json.loads(message["data"]))
+            except RedisError:
+                logger.warning("Потеряна подписка на события задач, переподключение через %s с",
+                               JOB_EVENTS_RECONNECT_DELAY)
+            finally:
+                await pubsub.close()
+            await asyncio.sleep(JOB_EVENTS_RECONNECT_DELAY)
+
+
+def fileEvent(job_file_id: int, file_name: str, status: str, error: str = None, resume_id: int = None) -> dict:
+    return {"file_id": job_file_id, "file_name": file_name, "status": status,
+            "error": error, "resume_id": resume_id}
+
+
+job_events = JobEvents()
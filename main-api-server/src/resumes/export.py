@@ -0,0 +1,135 @@
+import csv
+import io
+import os
+import tempfile
+
+from fastapi import HTTPException
+from openpyxl import Workbook
+from sqlalchemy import select, func, literal
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from starlette.concurrency import run_in_threadpool
+
+from database.database import async_session
+from src.resumes.models import ResumeData, InputResume, Stack, Skill
+from src.search.service import facetMatches, resolveFacets
+
+EXPORT_FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+EXPORT_BATCH = int(os.getenv("EXPORT_BATCH", 1000))
+EXPORT_CHUNK_SIZE = 1024 * 1024
+# связи выгружаются одной ячейкой через запятую
+EXPORT_RELATIONS = {"stacks": (Stack, Stack.stack), "skills": (Skill, Skill.name)}
+
+
+def exportColumns(fields: str = None) -> list:
+    """
+    Разбирает fields — колонки выгрузки через запятую. Без параметра выгружается всё
+    :param fields:
+    :return:
+    """
+    allowed = [column.key for column in ResumeData.__mapper__.column_attrs if column.key not in ResumeData.hidden]
+    allowed += list(EXPORT_RELATIONS)
+    if fields is None:
+        return allowed
+    columns = [column for column in fields.split(",") if column]
+    if not columns or set(columns) - set(allowed):
+        raise HTTPException(400, f"fields может содержать только: {', '.join(allowed)}")
+    return columns
+
+
+def exportExpression(column: str):
+    if column not in EXPORT_RELATIONS:
+        return getattr(ResumeData, column)
+    model, value = EXPORT_RELATIONS[column]
+    return (select(func.string_agg(value, aggregate_order_by(literal(", "), model.id)))
+            .where(model.resume_id == ResumeData.id)
+            .scalar_subquery().label(column))
+
+
+async def exportRows(user_id: int, columns: list, selected: dict, batch_size: int = EXPORT_BATCH):
+    """
+    Отдаёт строки выгрузки пачками по ключу (id резюме). На каждую пачку — своя короткая сессия,
+    так что долгое скачивание не держит соединение с БД, а в памяти только одна пачка кортежей
+    :param user_id:
+    :param columns:
+    :param selected: фильтры по фасетам {фасет: [значения]}
+    :param batch_size:
+    :return:
+    """
+    query = (select(ResumeData.id, *[exportExpression(column) for column in columns])
+             .join(InputResume, InputResume.id == ResumeData.resume_id)
+             .where(InputResume.user_id == user_id, ResumeData.disabled.is_(False))
+             .order_by(ResumeData.id.desc()).limit(batch_size))
+    if selected:
+        query = query.where(ResumeData.id.in_(select(facetMatches(user_id, resolveFacets(selected)).c.resume_id)))
+    last_id = None
+    while True:
+        async with async_session() as db:
+            rows = (await db.execute(query if last_id is None else query.where(ResumeData.id < last_id))).all()
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        yield [row[1:] for row in rows]
+        if len(rows) < batch_size:
+            return
+
+
+async def csvExport(columns: list, batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM, чтобы Excel открыл кириллицу в UTF-8
+    buffer.write("\ufeff")
+    writer.writerow(columns)
+    async for rows in batches:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def appendRows(sheet, rows: list):
+    for row in rows:
+        sheet.append(row)
+
+
+async def xlsxExport(columns: list, batches):
+    """
+    XLSX — это zip, его нельзя отдавать до конца записи. Книга пишется в режиме write_only
+    (строки сразу уходят во временные файлы), затем файл отдаётся частями
+    :param columns:
+    :param batches:
+    :return:
+    """
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Резюме")
+    sheet.append(columns)
+    async for rows in batches:
+        await run_in_threadpool(appendRows, sheet, rows)
+    with tempfile.TemporaryFile() as file:
+        await run_in_threadpool(workbook.save, file)
+        file.seek(0)
+        while True:
+            chunk = await run_in_threadpool(file.read, EXPORT_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+
+def exportResumes(user_id: int, format: str, fields: str = None, selected: dict = None):
+    """
+    Генератор файла выгрузки резюме пользователя
+    :param user_id:
+    :param format: csv или xlsx
+    :param fields:
+    :param selected: фильтры по фасетам {фасет: [значения]}
+    :return:
+    """
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(400, f"format может быть только: {', '.join(EXPORT_FORMATS)}")
+    columns = exportColumns(fields)
+    batches = exportRows(user_id, columns, {facet: values for facet, values in (selected or {}).items() if values})
+    return csvExport(columns, batches) if format == "csv" else xlsxExport(columns, batches)
@@ -0,0 +1,43 @@
+import os
+
+from fastapi import HTTPException
+from starlette.datastructures import Headers
+
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", 300 * 1024 * 1024))
+# заголовки multipart вокруг файла
+UPLOAD_FORM_OVERHEAD = 64 * 1024
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Обрывает загрузку больше лимита до того, как Starlette разберёт форму и сложит файл на диск:
+    тело с большим Content-Length отклоняется при первом чтении, тело без него (chunked) —
+    как только принятые байты превысят лимит.
+    Ошибка поднимается из receive во время разбора формы, FastAPI пробрасывает HTTPException как есть
+    """
+
+    def __init__(self, app, path_prefix: str = "/resume/upload/",
+                 max_size: int = MAX_UPLOAD_SIZE + UPLOAD_FORM_OVERHEAD):
+        self.app = app
+        self.path_prefix = path_prefix
+        self.max_size = max_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.path_prefix):
+            await self.app(scope, receive, send)
+            return
+        content_length = Headers(scope=scope).get("content-length", "")
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            if content_length.isdigit() and int(content_length) > self.max_size:
+                raise HTTPException(413, "Размер файла превышен")
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_size:
+                    raise HTTPException(413, "Размер файла превышен")
+            return message
+
+        await self.app(scope, limited_receive, send)
@@ -1,16 +1,25 @@
-from sqlalchemy import Column, String, Integer, ForeignKey
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, String, Integer, ForeignKey, Index, Text, Computed, UniqueConstraint, text, \
+    TIMESTAMP, Boolean
+from sqlalchemy.dialects.postgresql import TSVECTOR, JSONB
+from sqlalchemy.orm import relationship, deferred
 
 from src.AbstractModel import AbstractModel
 
 
 class InputResume(AbstractModel):
     __tablename__ = "inputs"
+    __table_args__ = (
+        # список резюме пользователя постранично по курсору
+        Index("ix_inputs_user_id_id", "user_id", "id"),
+    )
 
     file_name = Column(String, nullable=False)
     sender = Column(String)
-    link = Column(String)
+    # хеш оригинала в file-server, по нему проверяем, нужен ли ещё оригинал
+    link = Column(String, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    # sha256 содержимого файла, по нему находим уже разобранные копии
+    content_hash = Column(String(64), index=True)
 
 
 class Education(AbstractModel):
@@ -43,9 +52,14 @@ class Company(AbstractModel):
 
 class Stack(AbstractModel):
     __tablename__ = "stack"
+    __table_args__ = (
+        Index("ix_stack_term_id_resume_id", "term_id", "resume_id"),
+    )
 
     stack = Column(String)
     resume_id = Column(Integer, ForeignKey("resumes_data.id"), index=True)
+    # термин словаря, см. src/terms
+    term_id = Column(Integer, ForeignKey("terms.id"))
 
     resume_data = relationship("ResumeData", back_populates="stacks")
 
@@ -61,10 +75,15 @@ class Achievement(AbstractModel):
 
 class Skill(AbstractModel):
     __tablename__ = "skills"
+    __table_args__ = (
+        Index("ix_skills_term_id_resume_id", "term_id", "resume_id"),
+    )
 
     resume_id = Column(Integer, ForeignKey("resumes_data.id"), index=True)
     name = Column(String)
     type = Column(String)
+    # термин словаря, см. src/terms
+    term_id = Column(Integer, ForeignKey("terms.id"))
 
     resume_data = relationship("ResumeData", back_populates="skills")
 
@@ -73,6 +92,18 @@ class Skill(AbstractModel):
 
 class ResumeData(AbstractModel):
     __tablename__ = "resumes_data"
+    __table_args__ = (
+        Index("ix_resumes_data_resume_id_id", "resume_id", "id"),
+        Index("ix_resumes_data_search_vector", "search_vector", postgresql_using="gin"),
+        Index("ix_resumes_data_search_title_trgm", "search_title", postgresql_using="gin",
+              postgresql_ops={"search_title": "gin_trgm_ops"}),
+        # удалённые резюме, которые ждут фоновой очистки
+        Index("ix_resumes_data_disabled_id", "id", postgresql_where=text("disabled")),
+        # резюме, которые ещё ждут бэкфилла фасетов
+        Index("ix_resumes_data_facets_pending_id", "id", postgresql_where=text("NOT facets_indexed")),
+    )
+    hidden = ['created_at', 'disabled', 'search_title', 'search_text', 'search_vector',
+              'email_key', 'phone_key', 'telegram_key', 'candidate_id', 'facets_indexed']
 
     resume_id = Column(Integer, ForeignKey("inputs.id"), index=True)
 
@@ -91,16 +122,112 @@ class ResumeData(AbstractModel):
     experience = Column(String)
     position = Column(String)
 
-    educations = relationship("Education", back_populates="resume", lazy="selectin")
-    stacks = relationship("Stack", back_populates="resume_data", lazy="selectin")
-    companies = relationship("Company", back_populates="resume_data", lazy="selectin")
-    achievements = relationship("Achievement", back_populates="resume_data", lazy="selectin")
-    skills = relationship("Skill", back_populates="resume_data", lazy="selectin")
+    # стаж и год рождения числами (см. src/resumes/numeric.py) для фильтров по диапазону и сортировки
+    experience_months = Column(Integer, index=True)
+    birth_year = Column(Integer, index=True)
+
+    # нормализованные контакты (см. src/resumes/contacts.py), по ним резюме одного человека
+    # из разных источников связываются в кластер: candidate_id — id резюме, с которого начался
+    # кластер, у него самого пусто
+    email_key = Column(String, index=True)
+    phone_key = Column(String, index=True)
+    telegram_key = Column(String, index=True)
+    candidate_id = Column(Integer, index=True)
+
+    # фасеты резюме записаны в resume_facets и учтены в facet_counts
+    facets_indexed = Column(Boolean, nullable=False, server_default="false")
+
+    # полнотекстовый поиск: заголовок (ФИО, должность, стек, навыки) весит больше текста
+    # (описания работы, достижения). Вектор считает сам Postgres, конфигурация russian
+    # стеммит и русские, и латинские слова (english_stem)
+    search_title = deferred(Column(Text))
+    search_text = deferred(Column(Text))
+    search_vector = deferred(Column(TSVECTOR, Computed(
+        "setweight(to_tsvector('russian', coalesce(search_title, '')), 'A') || "
+        "setweight(to_tsvector('russian', coalesce(search_text, '')), 'B')", persisted=True)))
+
+    # связи грузятся только явно в запросе (selectinload), см. resumeQueryOptions
+    educations = relationship("Education", back_populates="resume", lazy="raise")
+    stacks = relationship("Stack", back_populates="resume_data", lazy="raise")
+    companies = relationship("Company", back_populates="resume_data", lazy="raise")
+    achievements = relationship("Achievement", back_populates="resume_data", lazy="raise")
+    skills = relationship("Skill", back_populates="resume_data", lazy="raise")
+
+
+class ResumeDocument(AbstractModel):
+    __tablename__ = "resume_documents"
+    # готовый JSON резюме со всеми связями для чтения, пересобирается при изменении связей.
+    # Источник истины — нормализованные таблицы выше
+    __table_args__ = (
+        UniqueConstraint("resume_id", name="uq_resume_documents_resume_id"),
+    )
+
+    resume_id = Column(Integer, ForeignKey("resumes_data.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    document = Column(JSONB, nullable=False)
+
+
+class ResumeCount(AbstractModel):
+    __tablename__ = "resume_counts"
+    # количество резюме: всего (scope all), по пользователю (user) и по источнику (sender).
+    # Меняется в транзакциях сохранения и удаления резюме, периодически сверяется с таблицами
+    __table_args__ = (
+        UniqueConstraint("scope", "key", name="uq_resume_counts_scope_key"),
+    )
+
+    scope = Column(String, nullable=False)
+    key = Column(String, nullable=False)
+    count = Column(Integer, nullable=False, server_default="0")
 
 
 class Favorite(AbstractModel):
     __tablename__ = "favorites"
+    __table_args__ = (
+        # повторное добавление в избранное — ON CONFLICT DO NOTHING
+        UniqueConstraint("user_id", "resume_id", name="uq_favorites_user_id_resume_id"),
+        # список избранного постранично по курсору
+        Index("ix_favorites_user_id_id", "user_id", "id"),
+    )
 
     user_id = Column(Integer, ForeignKey("users.id"), index=True)
     resume_id = Column(Integer, ForeignKey("resumes_data.id"), index=True)
 
+
+class UploadJob(AbstractModel):
+    __tablename__ = "upload_jobs"
+    __table_args__ = (
+        # поиск брошенных задач среди незавершённых
+        Index("ix_upload_jobs_unfinished_lease_until", "lease_until",
+              postgresql_where=text("status IN ('queued', 'processing')")),
+    )
+    # queued -> processing -> done | failed
+    hidden = ['created_at', 'disabled', 'file_path', 'file_link', 'owner', 'lease_until']
+
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    sender = Column(String)
+    file_name = Column(String, nullable=False)
+    # хеш оригинала в file-server
+    file_link = Column(String)
+    # временный файл загрузки на диске API, только у задач, загруженных до переноса файлов в file-server
+    file_path = Column(String)
+    content_hash = Column(String(64))
+    status = Column(String, server_default="queued")
+    error = Column(String)
+    # реплика, которая разбирает задачу, и до какого момента за ней закреплена задача;
+    # просроченную задачу забирает любая другая реплика
+    owner = Column(String)
+    lease_until = Column(TIMESTAMP)
+
+    files = relationship("UploadJobFile", back_populates="job", lazy="selectin")
+
+
+class UploadJobFile(AbstractModel):
+    __tablename__ = "upload_job_files"
+    # queued -> parsing -> stored | failed
+    job_id = Column(Integer, ForeignKey("upload_jobs.id"), index=True)
+    file_name = Column(String, nullable=False)
+    status = Column(String, server_default="queued")
+    error = Column(String)
+    resume_id = Column(Integer, ForeignKey("resumes_data.id"))
+
+    job = relationship("UploadJob", back_populates="files")
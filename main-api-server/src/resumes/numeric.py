@@ -0,0 +1,108 @@
+import asyncio
+import datetime
+import logging
+import os
+import re
+
+from sqlalchemy import select, update, func, or_, literal_column
+
+from database.database import async_session
+from src.resumes.cache import resume_cache
+from src.resumes.models import ResumeData, ResumeDocument
+
+logger = logging.getLogger(__name__)
+
+NUMERIC_BACKFILL_BATCH = int(os.getenv("NUMERIC_BACKFILL_BATCH", 1000))
+MIN_BIRTH_YEAR = 1900
+# число без единиц в этих пределах — год («5 лет (2018-2023)»), а не стаж
+CALENDAR_YEARS = range(1900, 2101)
+EXPERIENCE_NUMBER = r"(\d+(?:[.,]\d+)?)\s*\+?\s*"
+EXPERIENCE_UNIT = r"(года|год|лет|г\b|years?|y\b|месяц\w*|мес|м\b|months?|mos?\b|m\b)?"
+# «14 лет 5 месяцев», «1 год», «2.5 года», «3 years 4 months», «6 мес.», «6 mo», «2 г. 3 м.»,
+# а также диапазоны «от 1 года до 3 лет», «1-3 года»
+EXPERIENCE_PART = re.compile(EXPERIENCE_NUMBER + EXPERIENCE_UNIT +
+                             r"(?:\s*(?:-|–|—|до|to)\s*" + EXPERIENCE_NUMBER + EXPERIENCE_UNIT + ")?",
+                             re.IGNORECASE)
+YEAR = re.compile(r"\b(19\d\d|20\d\d)\b")
+
+
+def parseExperienceMonths(experience: str):
+    """
+    Стаж в месяцах из строки парсера. Число без единиц считается годами, если это не календарный год.
+    Из диапазона берётся нижняя граница, единицы — у любой из границ: «1-3 года» -> 12
+    :param experience:
+    :return: месяцы или None, если стаж не распознан
+    """
+    months = None
+    for number, unit, upper, upper_unit in EXPERIENCE_PART.findall(experience or ""):
+        unit = unit or upper_unit
+        value = float(number.replace(",", "."))
+        if not unit and value in CALENDAR_YEARS:
+            continue
+        in_months = unit and unit.lower().startswith(("м", "m"))
+        months = (months or 0) + round(value if in_months else value * 12)
+    return months if months is not None and months < 12 * 80 else None
+
+
+def parseBirthYear(birth_date: str, age):
+    """
+    Год рождения из даты рождения, а если её нет — из возраста
+    :param birth_date:
+    :param age:
+    :return: год или None
+    """
+    this_year = datetime.date.today().year
+    match = YEAR.search(birth_date or "")
+    if match:
+        year = int(match.group(1))
+    elif str(age).strip().isdigit():
+        year = this_year - int(str(age).strip())
+    else:
+        return None
+    return year if MIN_BIRTH_YEAR <= year <= this_year else None
+
+
+def numericValues(age, birth_date: str, experience: str) -> dict:
+    return {"experience_months": parseExperienceMonths(experience), "birth_year": parseBirthYear(birth_date, age)}
+
+
+async def backfillNumericColumns(batch_size: int = NUMERIC_BACKFILL_BATCH):
+    """
+    Заполняет стаж в месяцах и год рождения у резюме, сохранённых до появления этих колонок,
+    и дописывает их в готовые документы
+    :param batch_size:
+    :return: сколько резюме обработано
+    """
+    total = 0
+    last_id = 0
+    while True:
+        async with async_session() as db:
+            rows = (await db.execute(select(ResumeData.id, ResumeData.age, ResumeData.birth_date,
+                                            ResumeData.experience)
+                                     .where(ResumeData.id > last_id, ResumeData.experience_months.is_(None),
+                                            ResumeData.birth_year.is_(None),
+                                            or_(ResumeData.experience.isnot(None), ResumeData.age.isnot(None),
+                                                ResumeData.birth_date.isnot(None)))
+                                     .order_by(ResumeData.id).limit(batch_size))).all()
+            if not rows:
+                break
+            values = [{"id": resume_id, **numericValues(age, birth_date, experience)}
+                      for resume_id, age, birth_date, experience in rows]
+            values = [value for value in values if value["experience_months"] is not None
+                      or value["birth_year"] is not None]
+            if values:
+                resume_ids = [value["id"] for value in values]
+                await db.execute(update(ResumeData), values)
+                await db.execute(update(ResumeDocument)
+                                 .where(ResumeDocument.resume_id == ResumeData.id, ResumeData.id.in_(resume_ids))
+                                 .values(document=ResumeDocument.document.op("||")(func.jsonb_build_object(
+                                     literal_column("'experience_months'"), ResumeData.experience_months,
+                                     literal_column("'birth_year'"), ResumeData.birth_year))))
+                await db.commit()
+                await resume_cache.invalidate(*resume_ids)
+            last_id = rows[-1][0]
+            total += len(values)
+        await asyncio.sleep(0)
+    if total:
+        logger.info("Стаж и год рождения заполнены для %s резюме", total)
+    return total
@@ -0,0 +1,118 @@
+import asyncio
+import logging
+import os
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy import select, delete, update, exists
+
+from database.database import async_session
+from src.resumes.models import ResumeData, InputResume, Education, Company, Stack, Achievement, Skill, Favorite, \
+    ResumeDocument, UploadJobFile
+from src.search.models import ResumeFacet
+from src.storage.client import file_storage
+
+logger = logging.getLogger(__name__)
+
+PURGE_BATCH = int(os.getenv("PURGE_BATCH", 5000))
+PURGE_INTERVAL = int(os.getenv("PURGE_INTERVAL", 600))
+# часы (по времени сервера), когда очистка может работать: "2-6" — с 2:00 до 6:00
+PURGE_HOURS = os.getenv("PURGE_HOURS", "2-6")
+PURGE_CHILDREN = (Education, Company, Stack, Achievement, Skill, Favorite, ResumeFacet, ResumeDocument)
+
+
+def isQuietHour(hour: int, hours: str = PURGE_HOURS) -> bool:
+    start, end = (int(part) for part in hours.split("-"))
+    return start <= hour < end if start <= end else hour >= start or hour < end
+
+
+async def purgeDisabledResumes(batch_size: int = PURGE_BATCH) -> dict:
+    """
+    Удаляет помеченные disabled резюме вместе с дочерними записями, входными файлами и их оригиналами в file-server.
+    Каждая пачка — отдельная короткая транзакция
+    :param batch_size:
+    :return: сколько строк удалено по таблицам
+    """
+    reclaimed = Counter()
+    while True:
+        async with async_session() as db:
+            rows = (await db.execute(select(ResumeData.id, ResumeData.resume_id)
+                                     .where(ResumeData.disabled.is_(True))
+                                     .order_by(ResumeData.id).limit(batch_size))).all()
+            if not rows:
+                break
+            resume_ids = [row.id for row in rows]
+            input_ids = [row.resume_id for row in rows if row.resume_id is not None]
+            for model in PURGE_CHILDREN:
+                result = await db.execute(delete(model).where(model.resume_id.in_(resume_ids)))
+                reclaimed[model.__tablename__] += result.rowcount
+            await db.execute(update(UploadJobFile).where(UploadJobFile.resume_id.in_(resume_ids))
+                             .values(resume_id=None))
+            result = await db.execute(delete(ResumeData).where(ResumeData.id.in_(resume_ids)))
+            reclaimed[ResumeData.__tablename__] += result.rowcount
+            files = (await db.execute(delete(InputResume).where(
+                InputResume.id.in_(input_ids), ~exists().where(ResumeData.resume_id == InputResume.id))
+                .returning(InputResume.user_id, InputResume.link))).all()
+            reclaimed[InputResume.__tablename__] += len(files)
+            await db.commit()
+            reclaimed["files"] += await deleteOriginals(db, files)
+        await asyncio.sleep(0)
+    return dict(reclaimed)
+
+
+async def deleteOriginals(db, files: list) -> int:
+    """
+    Удаляет из file-server оригиналы удалённых входных файлов, если на них больше никто не ссылается
+    :param db:
+    :param files: пары (user_id, link)
+    :return: сколько оригиналов удалено
+    """
+    links = {file.link for file in files if file.link is not None}
+    if not links:
+        return 0
+    orphans = links - set((await db.scalars(select(InputResume.link).where(InputResume.link.in_(links)))).all())
+    deleted = 0
+    for user_id, link in {(file.user_id, file.link) for file in files if file.link in orphans}:
+        try:
+            await file_storage.delete(user_id, link)
+            deleted += 1
+        except Exception:
+            logger.exception("Не удалось удалить оригинал %s из file-server", link)
+    return deleted
+
+
+class ResumePurger:
+    """
+    Фоновая очистка удалённых резюме: раз в PURGE_INTERVAL секунд проверяет, тихие ли сейчас часы,
+    и удаляет накопившееся. Итоги последнего запуска и за всё время отдаются в stats
+    """
+
+    def __init__(self):
+        self.last_run = None
+        self.last_reclaimed = {}
+        self.total_reclaimed = Counter()
+
+    async def run(self):
+        reclaimed = await purgeDisabledResumes()
+        self.last_run = datetime.now().isoformat()
+        self.last_reclaimed = reclaimed
+        self.total_reclaimed.update(reclaimed)
+        if reclaimed:
+            logger.info("Очистка удалённых резюме: %s", reclaimed)
+        return reclaimed
+
+    async def runPeriodically(self, interval: int = PURGE_INTERVAL):
+        while True:
+            if isQuietHour(datetime.now().hour):
+                try:
+                    await self.run()
+                except Exception:
+                    logger.exception("Очистка удалённых резюме упала")
+            await asyncio.sleep(interval)
+
+    def stats(self):
+        return {"hours": PURGE_HOURS, "last_run": self.last_run, "last_reclaimed": self.last_reclaimed,
+                "total_reclaimed": dict(self.total_reclaimed)}
+
+
+resume_purger = ResumePurger()
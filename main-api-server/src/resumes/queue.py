@@ -0,0 +1,77 @@
+import asyncio
+import logging
+import os
+import socket
+import uuid
+
+from fastapi import HTTPException
+
+logger = logging.getLogger(__name__)
+
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", 4))
+PARSE_QUEUE_SIZE = int(os.getenv("PARSE_QUEUE_SIZE", 1000))
+# на сколько секунд задача закрепляется за репликой; пока реплика её разбирает, аренда продлевается
+JOB_LEASE = int(os.getenv("JOB_LEASE", 60))
+REPLICA_ID = os.getenv("REPLICA_ID") or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class ParseQueue:
+    """
+    Очередь задач на разбор резюме с ограниченным пулом фоновых воркеров.
+    Воркер получает id задачи (UploadJob) и передаёт его в handler
+    """
+
+    def __init__(self, handler, workers: int = PARSE_WORKERS, maxsize: int = PARSE_QUEUE_SIZE):
+        self.handler = handler
+        self.workers_count = workers
+        self.maxsize = maxsize
+        self.queue = None
+        self.workers = []
+        # id задач в очереди, чтобы не ставить одну задачу дважды
+        self.pending = set()
+
+    async def start(self):
+        """
+        Создаёт очередь и запускает воркеры, вызывается на старте приложения
+        :return:
+        """
+        self.queue = asyncio.Queue(maxsize=self.maxsize)
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(self.workers_count)]
+
+    async def stop(self):
+        """
+        Останавливает воркеры
+        :return:
+        """
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+    def full(self) -> bool:
+        return self.queue is not None and self.queue.full()
+
+    def put(self, job_id: int):
+        """
+        Ставит задачу в очередь, если её там ещё нет
+        :param job_id:
+        :return:
+        """
+        if job_id in self.pending:
+            return
+        try:
+            self.queue.put_nowait(job_id)
+        except asyncio.QueueFull:
+            raise HTTPException(503, "Очередь на разбор переполнена, попробуйте позже")
+        self.pending.add(job_id)
+
+    async def _worker(self):
+        while True:
+            job_id = await self.queue.get()
+            self.pending.discard(job_id)
+            try:
+                await self.handler(job_id)
+            except Exception:
+                logger.exception("Задача разбора %s упала", job_id)
+            finally:
+                self.queue.task_done()
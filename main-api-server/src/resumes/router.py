@@ -1,12 +1,19 @@
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException
+from typing import List
+
+from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.responses import StreamingResponse
 
 from database.database import get_session
 from src.exceptions import SuccessResponse
-from src.jwt_handler import verify_token_and_check_role_hiring_manager_and_recruiter
-from src.resumes.schemas import UploadResume, AddFavorite, DeleteFavorite
+from src.jwt_handler import verify_token_and_check_role_hiring_manager_and_recruiter, \
+    verify_token_or_query_and_check_role_hiring_manager_and_recruiter
+from src.resumes.export import exportResumes, EXPORT_FORMATS
+from src.resumes.schemas import UploadResume, AddFavorite, DeleteFavorite, FavoriteIds, ResumeIds
 from src.resumes.service import upload_file, getResumeById, getMyResumes, deleteById, get_all_resumes_count, \
-    addToFavorite, getMyFavorites, deleteFromFavorites
+    addToFavorite, getMyFavorites, deleteFromFavorites, getJobStatus, getJobResults, getParserCacheStats, \
+    getMyResumesCount, addFavorites, removeFavorites, streamJobEvents, getDuplicates, \
+    getPurgeStats, getOriginal, getResumesByIds
 
 resumes_router = APIRouter(prefix="/resume", tags=["Resume"])
 
@@ -21,18 +28,80 @@ async def upload(sender: str,
     return await upload_file(db, token['id'], sender, file)
 
 
+@resumes_router.get("/jobs/{job_id}", summary="Статус разбора загруженного файла")
+async def get_job_status(job_id: int, db: AsyncSession = Depends(get_session),
+                         token=Depends(verify_token_and_check_role_hiring_manager_and_recruiter)):
+    return await getJobStatus(db, token['id'], job_id)
+
+
+@resumes_router.get("/jobs/{job_id}/events", summary="События разбора загруженного файла (SSE)")
+async def get_job_events(job_id: int, token=Depends(verify_token_or_query_and_check_role_hiring_manager_and_recruiter)):
+    return await streamJobEvents(token['id'], job_id)
+
+
+@resumes_router.get("/jobs/{job_id}/results", summary="Разобранные резюме загруженного файла")
+async def get_job_results(job_id: int, db: AsyncSession = Depends(get_session),
+                          token=Depends(verify_token_and_check_role_hiring_manager_and_recruiter)):
+    return await getJobResults(db, token['id'], job_id)
+
+
+@resumes_router.get("/parserCache/stats", summary="Статистика кеша парсера")
+async def parser_cache_stats(token=Depends(verify_token_and_check_role_hiring_manager_and_recruiter)):
+    return await getParserCacheStats()
+
+
+@resumes_router.get("/purge/stats", summary="Статистика очистки удалённых резюме")
+async def get_purge_stats(token=Depends(verify_token_and_check_role_hiring_manager_and_recruiter)):
+    return await getPurgeStats()
+
+
 @resumes_router.get("/getById", summary="Вернуть резюме по id")
-async def get_resume_by_id(resume_id: int, db: AsyncSession = Depends(get_session),
+async def get_resume_by_id(resume_id: int, fields: str = None, include: str = None,
+                           db: AsyncSession = Depends(get_session),
                            token=Depends(verify_token_and_check_role_hiring_manager_and_recruiter)):
 
-    return await getResumeById(db, resume_id, token['id'])
+    return await getResumeById(db, resume_id, token['id'], fields, include)
+
+
+@resumes_router.post("/getByIds", summary="Вернуть резюме по списку id")
+async def get_resumes_by_ids(data: ResumeIds, db: AsyncSession = Depends(get_session),
+                             token=Depends(verify_token_and_check_role_hiring_manager_and_recruiter)):
+    return await getResumesByIds(db, data.resume_ids, token['id'], data.fields, data.include)
 
 
 @resumes_router.get("/getMyResumes", summary="Вернуть мои резюме")
-async def get_my_resumes(limit: int = 10, offset: int = 0,
+async def get_my_resumes(limit: int = Query(10, ge=1, le=200), offset: int = Query(0, ge=0), cursor: str = None,
+                         fields: str = None, include: str = None,
+                         experience_from: int = Query(None, ge=0), experience_to: int = Query(None, ge=0),
+                         age_from: int = Query(None, ge=0), age_to: int = Query(None, ge=0),
+                         order: str = "new",
                          token=Depends(verify_token_and_check_role_hiring_manager_and_recruiter),
                          db: AsyncSession = Depends(get_session)):
-    return await getMyResumes(db, token['id'], limit, offset)
+    return await getMyResumes(db, token['id'], limit, offset, cursor, fields, include,
+                              experience_from, experience_to, age_from, age_to, order)
+
+
+@resumes_router.get("/export", summary="Выгрузить мои резюме в CSV или XLSX")
+async def export_resumes(format: str = "csv", fields: str = None,
+                         stack: List[str] = Query(None), skill: List[str] = Query(None),
+                         degree: List[str] = Query(None), position: List[str] = Query(None),
+                         token=Depends(verify_token_and_check_role_hiring_manager_and_recruiter)):
+    content = exportResumes(token['id'], format, fields,
+                            {"stack": stack, "skill": skill, "degree": degree, "position": position})
+    return StreamingResponse(content, media_type=EXPORT_FORMATS[format],
+                             headers={"Content-Disposition": f'attachment; filename="resumes.{format}"'})
+
+
+@resumes_router.get("/original", summary="Скачать исходный файл резюме")
+async def get_original(resume_id: int, token=Depends(verify_token_and_check_role_hiring_manager_and_recruiter),
+                       db: AsyncSession = Depends(get_session)):
+    return await getOriginal(db, token['id'], resume_id)
+
+
+@resumes_router.get("/duplicates", summary="Другие резюме того же кандидата")
+async def get_duplicates(resume_id: int, token=Depends(verify_token_and_check_role_hiring_manager_and_recruiter),
+                         db: AsyncSession = Depends(get_session)):
+    return await getDuplicates(db, token['id'], resume_id)
 
 
 @resumes_router.delete("/deleteById", summary="Удалить моё резюме")
@@ -48,6 +117,12 @@ async def get_all_count(token=Depends(verify_token_and_check_role_hiring_manager
     return await get_all_resumes_count(db)
 
 
+@resumes_router.get("/getMyCount", summary="Получить количество моих резюме и резюме по источникам")
+async def get_my_count(token=Depends(verify_token_and_check_role_hiring_manager_and_recruiter),
+                       db: AsyncSession = Depends(get_session)):
+    return await getMyResumesCount(db, token['id'])
+
+
 @resumes_router.post("/addToFavorite", summary="Добавить в избранное")
 async def add_to_favorite(data: AddFavorite, token=Depends(verify_token_and_check_role_hiring_manager_and_recruiter),
                           db: AsyncSession = Depends(get_session)):
@@ -55,9 +130,22 @@ async def add_to_favorite(data: AddFavorite, token=Depends(verify_token_and_chec
 
 
 @resumes_router.get("/favorites", summary="Получить мои избранные")
-async def get_my_favorites(token=Depends(verify_token_and_check_role_hiring_manager_and_recruiter),
-                          db: AsyncSession = Depends(get_session)):
-    return await getMyFavorites(db, token['id'])
+async def get_my_favorites(limit: int = Query(50, ge=1, le=200), cursor: str = None,
+                           token=Depends(verify_token_and_check_role_hiring_manager_and_recruiter),
+                           db: AsyncSession = Depends(get_session)):
+    return await getMyFavorites(db, token['id'], limit, cursor)
+
+
+@resumes_router.post("/favorites", summary="Добавить в избранное много резюме")
+async def add_favorites(data: FavoriteIds, token=Depends(verify_token_and_check_role_hiring_manager_and_recruiter),
+                        db: AsyncSession = Depends(get_session)):
+    return await addFavorites(db, token['id'], data.resume_ids)
+
+
+@resumes_router.delete("/favorites", summary="Удалить из избранного много резюме")
+async def remove_favorites(data: FavoriteIds, token=Depends(verify_token_and_check_role_hiring_manager_and_recruiter),
+                           db: AsyncSession = Depends(get_session)):
+    return await removeFavorites(db, token['id'], data.resume_ids)
 
 
 @resumes_router.delete("/delete_favorite", summary="Удалить избранное")
@@ -1,4 +1,9 @@
-from pydantic import BaseModel
+from typing import List, Optional
+
+from pydantic import BaseModel, Field
+
+FAVORITES_BATCH_LIMIT = 500
+RESUMES_BATCH_LIMIT = 300
 
 
 class UploadResume(BaseModel):
@@ -10,4 +15,13 @@ class AddFavorite(BaseModel):
 
 
 class DeleteFavorite(AddFavorite):
-    pass
\ No newline at end of file
+    pass
+
+class FavoriteIds(BaseModel):
+    resume_ids: List[int] = Field(..., min_length=1, max_length=FAVORITES_BATCH_LIMIT)
+
+
+class ResumeIds(BaseModel):
+    resume_ids: List[int] = Field(..., min_length=1, max_length=RESUMES_BATCH_LIMIT)
+    fields: Optional[str] = None
+    include: Optional[str] = None
@@ -1,390 +1,1019 @@
+import asyncio
+import hashlib
 import json
+import logging
 import os
 import zipfile
-from datetime import datetime
+from datetime import datetime, timedelta
 
-import requests
 from fastapi import UploadFile, File, Depends, HTTPException
-from fastapi_cache.decorator import cache
-from sqlalchemy import select, delete, func
+from sqlalchemy import select, delete, update, insert, literal, or_, tuple_, and_, func, exists
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload, load_only
+from starlette.concurrency import run_in_threadpool
+from sse_starlette.sse import EventSourceResponse
+from starlette.responses import Response
 
-from database.database import get_session
+from database.database import get_session, async_session
 from src.AbstractModel import query_fetchone, query_fetchall
 from src.exceptions import SuccessResponse
+from src.pagination import encode_cursor, decode_cursor
 from src.mail.send import send_to_resumer
-from src.resumes.models import InputResume, Education, Company, Stack, Achievement, ResumeData, Favorite, Skill
+from src.parser.cache import parser_cache
+from src.parser.client import parser_client
+from src.resumes.cache import resume_cache
+from src.resumes.events import job_events, fileEvent, JOB_FINISHED, JOB_EVENTS_POLL_INTERVAL
+from src.resumes.limits import MAX_UPLOAD_SIZE
+from src.resumes.numeric import numericValues
+from src.resumes.contacts import contactKeys, linkCandidate, candidateKey
+from src.resumes.counters import changeResumeCounts, getResumeCount, getResumeCounts
+from src.resumes.models import InputResume, Company, Stack, Achievement, ResumeData, Favorite, Skill, \
+    UploadJob, UploadJobFile, ResumeDocument
+from src.resumes.purge import resume_purger
+from src.resumes.queue import ParseQueue, JOB_LEASE, REPLICA_ID
 from src.resumes.schemas import UploadResume
+from src.storage.client import file_storage, HashingReader
+from src.search.service import searchDocument, indexResumeFacets, removeResumeFacets
+from src.templates.matcher import resume_matcher, resumeTerms
+from src.terms.service import term_dictionary
 
+logger = logging.getLogger(__name__)
 
-async def send_file(file_path: str, url: str):
-    """Отправляет файл на указанный URL в теле запроса"""
+RESUME_EXTENSIONS = (".pdf", ".docx", ".rtf")
+RESUME_RELATIONS = ("educations", "stacks", "companies", "achievements", "skills")
+RESUME_ORDERS = ("new", "experience")
+ZIP_CONCURRENCY = int(os.getenv("ZIP_CONCURRENCY", 8))
+
+
+async def send_file(filename: str, content: bytes):
+    """Отправляет содержимое файла в парсер резюме через общий пул соединений"""
     try:
-        file_extension = os.path.splitext(file_path)[1].lower()
+        file_extension = os.path.splitext(filename)[1].lower()
         if file_extension in (".pdf", ".docx", ".rtf", ".zip"):
-            with open(file_path, "rb") as file:
-                response = requests.post(url, files={"file": file})
-            if response.status_code == 200:
-                response_data = json.loads(response.text)
-                return response_data
-            else:
-                raise HTTPException(status_code=response.status_code, detail=response.text)
+            return await parser_client.parse(os.path.basename(filename), content)
         else:
-            print(f"Файл {file_path} с расширением {file_extension} игнорируется.")
+            print(f"Файл {filename} с расширением {file_extension} игнорируется.")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-async def save_files_in_db(db: AsyncSession, filename: str, sender: str, user_id: int) -> InputResume:
+def optionalStr(value):
+    """str(value), но пустое значение остаётся None, а не строкой «None»"""
+    return None if value is None else str(value)
+
+
+async def saveParsedResume(db: AsyncSession, model_answer: dict, filename: str, sender: str, user_id: int,
+                           content_hash: str = None, link: str = None) -> dict:
     """
-    Сохраняет входной файл в базу данных
+    Сохраняет ответ парсера одной транзакцией: входной файл, резюме и все дочерние записи
+    многострочными insert. Возвращает сериализованное резюме без повторного чтения из БД
     :param db:
+    :param model_answer:
     :param filename:
     :param sender:
     :param user_id:
+    :param content_hash:
+    :param link: хеш оригинала в file-server
     :return:
     """
-    file = InputResume(file_name=filename, sender=sender, user_id=user_id)
-    db.add(file)
-    await db.commit()
-    await db.refresh(file)
-    return file
+    person = model_answer['person']
+    contact = model_answer['contact']
+    stats = model_answer['stats']
+    resume_values = dict(first_name=person['first_name'], last_name=person['last_name'],
+                         middle_name=person['middle_name'], age=optionalStr(person['age']), email=contact['email'],
+                         phone_number=contact['phone_number'], telegram=contact['telegram'],
+                         hh_url=model_answer['hh-url'], birth_date=person['birth_date'],
+                         degree=optionalStr(stats['degree']), experience=optionalStr(stats['experience']),
+                         position=optionalStr(stats['position']))
+    resume_values.update(numericValues(resume_values['age'], resume_values['birth_date'],
+                                       resume_values['experience']))
+    term_ids = await term_dictionary.resolve([stack['stack'] for stack in model_answer['stack']] +
+                                             [skill['name'] for skill in model_answer['skills']])
+    children = {
+        "achievements": (Achievement, [{"description": ach['description']} for ach in model_answer['achievements']]),
+        "companies": (Company, [{"name": job['job_company'], "start_date": job['start_date'],
+                                 "end_date": job['end_date'], "job_description": job['job_description'],
+                                 "job_location": job['job_location']}
+                                for job in model_answer['jobs']]),
+        "stacks": (Stack, [{"stack": stack['stack'], "term_id": term_ids.get(stack['stack'])}
+                           for stack in model_answer['stack']]),
+        "skills": (Skill, [{"name": skill['name'], "type": skill['type'], "term_id": term_ids.get(skill['name'])}
+                           for skill in model_answer['skills']]),
+    }
+    search_title, search_text = searchDocument({**resume_values,
+                                                **{key: rows for key, (model, rows) in children.items()}})
+    try:
+        new_file = await db.scalar(insert(InputResume).values(file_name=filename, sender=sender, user_id=user_id,
+                                                              content_hash=content_hash, link=link)
+                                   .returning(InputResume))
+        keys = contactKeys(resume_values['email'], resume_values['phone_number'], resume_values['telegram'])
+        candidate_id = await linkCandidate(db, keys, user_id)
+        resume = await db.scalar(insert(ResumeData).values(resume_id=new_file.id, search_title=search_title,
+                                                           search_text=search_text, candidate_id=candidate_id,
+                                                           facets_indexed=True, **keys, **resume_values)
+                                 .returning(ResumeData))
 
+        # education из ответа парсера пока не сохраняем
+        result = await resume.to_dict()
+        result['educations'] = []
+        for key, (model, rows) in children.items():
+            rows = [{**row, "resume_id": resume.id} for row in rows]
+            instances = (await db.scalars(insert(model).returning(model), rows)).all() if rows else []
+            result[key] = [await instance.to_dict() for instance in instances]
+        await indexResumeFacets(db, resume.id, user_id, result)
+        await db.execute(insert(ResumeDocument).values(resume_id=resume.id, user_id=user_id, document=result))
+        await changeResumeCounts(db, [(user_id, sender)], 1)
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+    await resume_matcher.publishAdd(resume.id, user_id, resumeTerms(result), result['experience_months'])
+    return result
 
-async def addEducation(db: AsyncSession, start_year: int = None, end_year: int = None,
-                       name: str = None, tier: str = None, resume_id: int = None, department_name: str = None):
+
+async def setJobStatus(db: AsyncSession, job_id: int, status: str, error: str = None):
     """
-    Добавляет университет
+    Обновляет статус задачи на разбор
     :param db:
-    :param start_year:
-    :param end_year:
-    :param name:
-    :param tier:
-    :param resume_id:
-    :param department_name:
+    :param job_id:
+    :param status:
+    :param error:
     :return:
     """
-    start_year = int(start_year)
-    end_year = int(end_year)
-    education = Education(start_year=start_year, end_year=end_year, name=name,
-                          tier=tier, resume_id=resume_id, department_name=department_name)
-    db.add(education)
+    await db.execute(update(UploadJob).where(UploadJob.id == job_id).values(status=status, error=error))
     await db.commit()
-    await db.refresh(education)
-    return education
+    await job_events.publish(job_id, "job", {"job_status": status, "error": error})
 
 
-async def addCompany(db: AsyncSession, name: str, resume_id: int, start_date: str,
-                     end_date: str, job_description: str,
-                     job_location: str):
+async def setJobFileStatus(db: AsyncSession, job_file_id: int, status: str,
+                           error: str = None, resume_id: int = None):
     """
-    Добавляет компанию к резюме
+    Обновляет статус файла внутри задачи
     :param db:
-    :param name:
+    :param job_file_id:
+    :param status:
+    :param error:
     :param resume_id:
-    :param start_date:
-    :param end_date:
-    :param job_description:
-    :param job_location:
-    :return:
-    """
-    # if start_date.count("-") == 1:
-    #     start_date += "-01"
-    # if end_date.count("-"):
-    #     end_date += "-01"
-    # if end_date == '':
-    #     end_date = None
-    # if start_date is not None:
-    #     start_date_obj = datetime.strptime(start_date, "%Y-%m-%d").date()
-    # else: start_date_obj = None
-    # if end_date is not None:
-    #     end_date_obj = datetime.strptime(end_date, "%Y-%m-%d").date()
-    # else: end_date_obj = None
-    company = Company(name=name, resume_id=resume_id, start_date=start_date,
-                      end_date=end_date, job_description=job_description, job_location=job_location)
-    db.add(company)
+    :return:
+    """
+    job_file = (await db.execute(update(UploadJobFile).where(UploadJobFile.id == job_file_id)
+                                 .values(status=status, error=error, resume_id=resume_id)
+                                 .returning(UploadJobFile.job_id, UploadJobFile.file_name))).first()
     await db.commit()
-    await db.refresh(company)
-    return company
+    if job_file is not None:
+        await job_events.publish(job_file.job_id, status,
+                                 fileEvent(job_file_id, job_file.file_name, status, error, resume_id))
 
 
-async def addStack(db: AsyncSession, stack: str, resume_id: int):
+async def addJobFiles(db: AsyncSession, job_id: int, filenames: list) -> list:
     """
-    Добавляет стек к резюме
+    Регистрирует файлы задачи, возвращает их id в том же порядке
     :param db:
-    :param stack:
-    :param resume_id:
+    :param job_id:
+    :param filenames:
     :return:
     """
-    stack = Stack(stack=stack, resume_id=resume_id)
-    db.add(stack)
+    job_files = [UploadJobFile(job_id=job_id, file_name=filename) for filename in filenames]
+    db.add_all(job_files)
     await db.commit()
-    await db.refresh(stack)
-    return stack
+    for job_file in job_files:
+        await job_events.publish(job_id, "queued", fileEvent(job_file.id, job_file.file_name, "queued"))
+    return [job_file.id for job_file in job_files]
+
+
+async def parseResumeFile(filename: str, content: bytes, content_hash: str = None):
+    """
+    Разбирает файл через кеш ответов парсера, в парсер идёт только при промахе
+    :param filename:
+    :param content:
+    :param content_hash:
+    :return:
+    """
+    if content_hash is not None:
+        model_answer = await parser_cache.get(content_hash)
+        if model_answer is not None:
+            return model_answer
+    model_answer = await send_file(filename, content)
+    if content_hash is not None and model_answer is not None and 'result' not in model_answer.keys():
+        await parser_cache.set(content_hash, model_answer)
+    return model_answer
+
+
+async def getPurgeStats():
+    """
+    Сколько строк освободила фоновая очистка удалённых резюме
+    :return:
+    """
+    return SuccessResponse({"purge": resume_purger.stats()})
+
+
+async def getParserCacheStats():
+    """
+    Попадания и промахи кеша парсера
+    :return:
+    """
+    return SuccessResponse({"cache": parser_cache.stats()})
+
+
+def resumeToModelAnswer(resume: ResumeData) -> dict:
+    """
+    Собирает из сохранённого резюме ответ в формате парсера, чтобы сохранить копию без повторного разбора
+    :param resume:
+    :return:
+    """
+    return {
+        "person": {"first_name": resume.first_name, "last_name": resume.last_name,
+                   "middle_name": resume.middle_name, "age": resume.age, "birth_date": resume.birth_date},
+        "contact": {"email": resume.email, "phone_number": resume.phone_number, "telegram": resume.telegram},
+        "hh-url": resume.hh_url,
+        "stats": {"degree": resume.degree, "experience": resume.experience, "position": resume.position},
+        "achievements": [{"description": ach.description} for ach in resume.achievements],
+        "jobs": [{"job_company": job.name, "start_date": job.start_date, "end_date": job.end_date,
+                  "job_description": job.job_description, "job_location": job.job_location}
+                 for job in resume.companies],
+        "stack": [{"stack": stack.stack} for stack in resume.stacks],
+        "skills": [{"name": skill.name, "type": skill.type} for skill in resume.skills],
+    }
 
 
-async def addAchievement(db: AsyncSession, description: str, resume_id: int):
+async def findResumeByHash(db: AsyncSession, content_hash: str, user_id: int):
     """
-    Добавить ачивмент к резюме
+    Ищет уже разобранный файл с таким же содержимым, сначала среди резюме пользователя
     :param db:
-    :param description:
-    :param resume_id:
+    :param content_hash:
+    :param user_id:
+    :return: (ResumeData, id владельца) или None
+    """
+    if content_hash is None:
+        return None
+    result = await db.execute(select(ResumeData, InputResume.user_id)
+                              .join(InputResume, InputResume.id == ResumeData.resume_id)
+                              .options(*resumeQueryOptions(include=("stacks", "companies", "achievements", "skills")))
+                              .where(InputResume.content_hash == content_hash, ResumeData.disabled.is_(False))
+                              .order_by((InputResume.user_id == user_id).desc(), ResumeData.id)
+                              .limit(1))
+    return result.first()
+
+
+async def processJobFile(db: AsyncSession, job_id: int, job_file_id: int, filename: str, content: bytes,
+                         sender: str, user_id: int, content_hash: str = None, link: str = None):
+    """
+    Отправляет один файл в парсер и сохраняет результат.
+    Если такой файл уже разбирали, парсер не вызывается: своё резюме переиспользуется,
+    чужое копируется пользователю
+    :param db:
+    :param job_id:
+    :param job_file_id:
+    :param filename:
+    :param content:
+    :param sender:
+    :param user_id:
+    :param content_hash:
     :return:
     """
-    achievement = Achievement(description=description, resume_id=resume_id)
-    db.add(achievement)
-    await db.commit()
-    await db.refresh(achievement)
-    return achievement
+    await setJobFileStatus(db, job_file_id, "parsing")
+    try:
+        known = await findResumeByHash(db, content_hash, user_id)
+        if known is not None and known[1] == user_id:
+            await setJobFileStatus(db, job_file_id, "stored", resume_id=known[0].id)
+            return
+        if known is not None:
+            model_answer = resumeToModelAnswer(known[0])
+        else:
+            model_answer = await parseResumeFile(filename, content, content_hash)
+        if model_answer is None:
+            raise HTTPException(403, "Сервер недостаточно точно распознал резюме")
+        if 'result' in model_answer.keys():
+            raise HTTPException(403, "Документ не может быть разобран")
+        await job_events.publish(job_id, "parsed", fileEvent(job_file_id, filename, "parsed"))
+        if link is None:
+            link = await file_storage.upload(user_id, filename, content)
+        resume = await saveParsedResume(db, model_answer, filename, sender, user_id, content_hash, link)
+    except Exception as e:
+        await db.rollback()
+        error = e.detail if isinstance(e, HTTPException) else str(e)
+        await setJobFileStatus(db, job_file_id, "failed", error=str(error))
+        return
+    await setJobFileStatus(db, job_file_id, "stored", resume_id=resume['id'])
 
 
-async def addSkill(db: AsyncSession,
-                   resume_id: int, name: str, type: str):
+def read_archive_member(zip_file: zipfile.ZipFile, file_info: zipfile.ZipInfo):
+    """
+    Читает файл архива не больше MAX_UPLOAD_SIZE: размер из заголовка архива можно подделать,
+    поэтому лимит проверяется и по фактически распакованным байтам
     """
-    Добавляет качества человечку
+    if file_info.file_size > MAX_UPLOAD_SIZE:
+        raise HTTPException(413, "Размер файла превышен")
+    with zip_file.open(file_info) as member:
+        content = member.read(MAX_UPLOAD_SIZE + 1)
+    if len(content) > MAX_UPLOAD_SIZE:
+        raise HTTPException(413, "Размер файла превышен")
+    return content, hashlib.sha256(content).hexdigest()
+
+
+async def processArchiveMember(zip_file: zipfile.ZipFile, file_info: zipfile.ZipInfo, job_id: int, job_file_id: int,
+                               sender: str, user_id: int, semaphore: asyncio.Semaphore):
+    """
+    Читает файл прямо из архива, без распаковки на диск, и разбирает его в своей сессии.
+    Повреждённый или слишком большой файл помечается failed, остальные файлы архива разбираются дальше
+    :param zip_file:
+    :param file_info:
+    :param job_id:
+    :param job_file_id:
+    :param sender:
+    :param user_id:
+    :param semaphore:
+    :return:
+    """
+    async with semaphore:
+        async with async_session() as db:
+            try:
+                content, content_hash = await run_in_threadpool(read_archive_member, zip_file, file_info)
+            except Exception as e:
+                error = e.detail if isinstance(e, HTTPException) else str(e)
+                await setJobFileStatus(db, job_file_id, "failed", error=str(error))
+                return job_file_id
+            await processJobFile(db, job_id, job_file_id, file_info.filename, content, sender, user_id,
+                                 content_hash)
+    return job_file_id
+
+
+async def processArchive(db: AsyncSession, job_id: int, archive, sender: str, user_id: int):
+    """
+    Разбирает файлы архива параллельно, не больше ZIP_CONCURRENCY одновременно.
+    Архив закрывается только после того, как закончились все файлы
     :param db:
-    :param resume_id:
-    :param name:
-    :param type:
+    :param job_id:
+    :param archive: файловый объект архива
+    :param sender:
+    :param user_id:
     :return:
     """
+    if not zipfile.is_zipfile(archive):
+        raise HTTPException(403, "Архив повреждён")
+    with zipfile.ZipFile(archive) as zip_file:
+        members = [file_info for file_info in zip_file.infolist()
+                   if not file_info.is_dir() and file_info.filename.endswith(RESUME_EXTENSIONS)]
+        job_file_ids = await addJobFiles(db, job_id, [member.filename for member in members])
+        semaphore = asyncio.Semaphore(ZIP_CONCURRENCY)
+        results = await asyncio.gather(*[processArchiveMember(zip_file, file_info, job_id, job_file_id, sender,
+                                                              user_id, semaphore)
+                                          for file_info, job_file_id in zip(members, job_file_ids)],
+                                       return_exceptions=True)
+    for job_file_id, result in zip(job_file_ids, results):
+        if isinstance(result, Exception):
+            logger.error("Файл %s задачи %s упал: %s", job_file_id, job_id, result)
+            async with async_session() as file_db:
+                await setJobFileStatus(file_db, job_file_id, "failed", error=str(result))
 
-    skill = Skill(resume_id=resume_id, name=name, type=type)
-    db.add(skill)
-    await db.commit()
-    await db.refresh(skill)
-    return skill
+
+async def openJobFile(file_link: str, file_location: str):
+    """
+    Оригинал задачи из file-server. Задачи, загруженные до переноса файлов, читаются с диска API
+    :param file_link:
+    :param file_location:
+    :return: файловый объект
+    """
+    if file_link is not None:
+        return await file_storage.download(file_link)
+    return await run_in_threadpool(open, file_location, "rb")
 
 
-async def addResume(db: AsyncSession,
-                    input_id: int, first_name: str = None,
-                    last_name: str = None, middle_name: str = None,
-                    age: str = None, email: str = None,
-                    phone_number: str = None, telegram: str = None,
-                    hh_url: str = None, birth_date: str = None, degree: str = None,
-                    experience: str = None, position: str = None):
+async def processJob(job_id: int):
+    """
+    Обрабатывает задачу из очереди: разбирает одиночный файл или все файлы архива
+    :param job_id:
+    :return:
     """
+    async with async_session() as db:
+        job = await claimJob(db, job_id)
+        if job is None:
+            return
+        user_id, sender, filename = job.user_id, job.sender, job.file_name
+        file_link, file_location, content_hash = job.file_link, job.file_path, job.content_hash
+        await job_events.publish(job_id, "job", {"job_status": "processing", "error": None})
+        lease = asyncio.create_task(renewJobLease(job_id))
+        try:
+            with await openJobFile(file_link, file_location) as file:
+                if filename.endswith(".zip"):
+                    await processArchive(db, job_id, file, sender, user_id)
+                else:
+                    job_file_ids = await addJobFiles(db, job_id, [filename])
+                    content = await run_in_threadpool(file.read)
+                    await processJobFile(db, job_id, job_file_ids[0], filename, content, sender, user_id,
+                                         content_hash, file_link)
+        except Exception as e:
+            await db.rollback()
+            error = e.detail if isinstance(e, HTTPException) else str(e)
+            await setJobStatus(db, job_id, "failed", str(error))
+            await releaseJobFile(db, user_id, file_link)
+            return
+        finally:
+            lease.cancel()
+            await run_in_threadpool(remove_file, file_location)
+        await setJobStatus(db, job_id, "done")
+        # оригинал нужен до завершения задачи: незаконченную задачу подхватит другая реплика
+        await releaseJobFile(db, user_id, file_link)
 
-    :param position:
-    :param experience:
-    :param degree:
+
+async def releaseJobFile(db: AsyncSession, user_id: int, file_link: str):
+    """
+    Удаляет оригинал задачи из file-server, если на него не сослалось ни одно резюме:
+    архив, повтор своего же файла или файл, который не удалось разобрать
     :param db:
-    :param input_id:
-    :param first_name:
-    :param last_name:
-    :param middle_name:
-    :param age:
-    :param email:
-    :param phone_number:
-    :param telegram:
-    :param hh_url:
-    :param birth_date:
-    :return:
-    """
-    #if birth_date:
-    #birth_date = datetime.strptime(birth_date, "%Y-%m-%d").date()
-
-    age = str(age)
-    degree = str(degree)
-    experience = str(experience)
-    position = str(position)
-
-    resume_data = ResumeData(resume_id=input_id, first_name=first_name,
-                             last_name=last_name, middle_name=middle_name,
-                             age=age, email=email, phone_number=phone_number,
-                             telegram=telegram, hh_url=hh_url, birth_date=birth_date, degree=degree,
-                             experience=experience, position=position)
-    db.add(resume_data)
+    :param user_id:
+    :param file_link:
+    :return:
+    """
+    if file_link is None:
+        return
+    try:
+        if await db.scalar(select(exists().where(InputResume.link == file_link))):
+            return
+        await file_storage.delete(user_id, file_link)
+    except Exception:
+        logger.exception("Не удалось удалить оригинал задачи %s из file-server", file_link)
+
+
+parse_queue = ParseQueue(processJob)
+
+
+def jobLeaseUntil():
+    return func.now() + timedelta(seconds=JOB_LEASE)
+
+
+def jobLeaseExpired():
+    return or_(UploadJob.lease_until.is_(None), UploadJob.lease_until < func.now())
+
+
+async def claimJob(db: AsyncSession, job_id: int):
+    """
+    Закрепляет задачу за этой репликой и переводит её в processing.
+    Задачу берём, если она поставлена в очередь этой репликой или аренда другой реплики истекла
+    :param db:
+    :param job_id:
+    :return: задача или None, если её разбирает другая реплика или она уже завершена
+    """
+    job = (await db.execute(update(UploadJob)
+                            .where(UploadJob.id == job_id, UploadJob.status.in_(("queued", "processing")),
+                                   or_(and_(UploadJob.status == "queued", UploadJob.owner == REPLICA_ID),
+                                       jobLeaseExpired()))
+                            .values(status="processing", error=None, owner=REPLICA_ID, lease_until=jobLeaseUntil())
+                            .returning(UploadJob.user_id, UploadJob.sender, UploadJob.file_name,
+                                       UploadJob.file_link, UploadJob.file_path, UploadJob.content_hash))).first()
+    if job is not None:
+        # файлы, начатые упавшей репликой, разбираем заново
+        await db.execute(delete(UploadJobFile).where(UploadJobFile.job_id == job_id))
     await db.commit()
-    await db.refresh(resume_data)
-    return resume_data
+    return job
+
+
+async def renewJobLease(job_id: int):
+    """
+    Продлевает аренду задачи, пока реплика её разбирает
+    :param job_id:
+    :return:
+    """
+    while True:
+        await asyncio.sleep(JOB_LEASE / 3)
+        try:
+            async with async_session() as db:
+                await db.execute(update(UploadJob)
+                                 .where(UploadJob.id == job_id, UploadJob.owner == REPLICA_ID)
+                                 .values(lease_until=jobLeaseUntil()))
+                await db.commit()
+        except Exception:
+            logger.exception("Не удалось продлить аренду задачи %s", job_id)
+
+
+async def requeuePendingJobs():
+    """
+    Ставит в очередь брошенные задачи: незавершённые, чья аренда истекла
+    (реплика упала или перезапустилась). Сама задача забирается атомарно в claimJob
+    :return:
+    """
+    async with async_session() as db:
+        jobs = await db.scalars(select(UploadJob.id)
+                                .where(UploadJob.status.in_(("queued", "processing")), jobLeaseExpired())
+                                .order_by(UploadJob.id))
+        job_ids = jobs.all()
+    for job_id in job_ids:
+        try:
+            parse_queue.put(job_id)
+        except HTTPException:
+            # очередь заполнена, остальные задачи заберём при следующем обходе
+            break
+
+
+async def requeuePendingJobsPeriodically(interval: int = JOB_LEASE):
+    """
+    Ищет брошенные задачи на старте и затем раз в interval секунд
+    :param interval:
+    :return:
+    """
+    while True:
+        try:
+            await requeuePendingJobs()
+        except Exception:
+            logger.exception("Не удалось вернуть в очередь брошенные задачи")
+        await asyncio.sleep(interval)
+
+
+def remove_file(file_path: str):
+    if file_path and os.path.exists(file_path):
+        os.remove(file_path)
+
+
+async def store_upload(user_id: int, file: UploadFile):
+    """
+    Потоком отправляет загрузку в file-server и по пути считает sha256.
+    Здесь лимит проверяется точно по размеру файла, а слишком большое тело запроса
+    обрывает ещё до разбора формы UploadSizeLimitMiddleware
+    :param user_id:
+    :param file:
+    :return: хеш оригинала в file-server и sha256 содержимого
+    """
+    if file.size is not None and file.size > MAX_UPLOAD_SIZE:
+        raise HTTPException(413, "Размер файла превышен")
+    reader = HashingReader(file.file, MAX_UPLOAD_SIZE)
+    link = await file_storage.upload(user_id, file.filename, reader)
+    return link, reader.hexdigest()
 
 
 async def upload_file(db: AsyncSession,
                       user_id: int,
                       sender: str,
                       file: UploadFile = File(...)):
-    file_location = f"files/{file.filename}"
-    result = []
-    if not file.filename.endswith((".pdf", ".docx", ".zip", ".rtf")):
-        return SuccessResponse({"result": result})
+    """
+    Принимает файл и ставит его разбор в очередь, сразу отдаёт id задачи
+    :param db:
+    :param user_id:
+    :param sender:
+    :param file:
+    :return:
+    """
+    if not file.filename.endswith(RESUME_EXTENSIONS + (".zip",)):
+        raise HTTPException(403, "Файл не .pdf/.docx/.rtf/.zip")
+    # отказываем до сохранения оригинала и задачи, чтобы повтор клиента не создавал дублей
+    if parse_queue.full():
+        raise HTTPException(503, "Очередь на разбор переполнена, попробуйте позже")
+    file_link, content_hash = await store_upload(user_id, file)
+
+    job = UploadJob(user_id=user_id, sender=sender, file_name=file.filename,
+                    file_link=file_link, content_hash=content_hash, status="queued",
+                    owner=REPLICA_ID, lease_until=jobLeaseUntil())
+    db.add(job)
+    await db.commit()
+    await db.refresh(job)
     try:
-        with open(file_location, "wb+") as file_object:
-            file_object.write(await file.read())
-        url = "http://192.168.137.103:8080/resume/scrab"
-        if file.filename.endswith(".zip"):
-            if zipfile.is_zipfile(file_location):
-                with zipfile.ZipFile(file_location) as zip_file:
-                    for file_info in zip_file.infolist():
-                        if not file_info.is_dir():
-                            extract_path = os.path.join("files", file_info.filename)
-                            zip_file.extract(file_info, "files/")
-                            if not file_info.filename.endswith(".pdf") and not file_info.filename.endswith(
-                                    ".docx") and not file_info.filename.endswith(".rtf"):
-                                continue
-                            try:
-                                model_answer = await send_file(extract_path, f"{url}")
-                                if model_answer is None:
-                                    continue
-                                if 'result' in model_answer.keys():
-                                    continue
-                                #result.append(model_answer)
-                            except Exception as E:
-                                continue
-                            new_file = await save_files_in_db(db, file_info.filename, sender, user_id)
-                            person = model_answer['person']
-                            contact = model_answer['contact']
-                            resume = await addResume(db, new_file.id, person['first_name'], person['last_name'],
-                                                     person['middle_name'], person['age'], contact['email'],
-                                                     contact['phone_number'], contact['telegram'],
-                                                     model_answer['hh-url'],
-                                                     person['birth_date'], model_answer['stats']['degree'],
-                                                     model_answer['stats']['experience'],
-                                                     model_answer['stats']['position'])
-                            for ach in model_answer['achievements']:
-                                await addAchievement(db, ach['description'], resume.id)
-
-                            for job in model_answer['jobs']:
-                                await addCompany(db, job['job_company'], resume.id,
-                                                 job['start_date'], job['end_date'],
-                                                 job['job_description'], job['job_location'])
-
-                            # for education in model_answer['education']:
-                            #     new_education = await addEducation(db, education['start_year'], education['end_year'],
-                            #                                        education['name'], education['tier'],
-                            #                                        resume.id, education['department_name'][0]) ##### КОСТЫЛЬ!!!!!!!!!!!!!!!!!!!!!!!!!!!!1
-                            for stack in model_answer['stack']:
-                                new_stack = await addStack(db, stack['stack'], resume.id)
-
-                            for skill in model_answer['skills']:
-                                await addSkill(db, resume.id, skill['name'], skill['type'])
-
-                            await db.refresh(resume)
-                            result.append([await resume.to_dict(educations=True, stacks=True,
-                                                                companies=True, achievements=True,
-                                                                skills=True)])
-                    return SuccessResponse({"response": result})
-                #return {"message": "Файлы из архива успешно отправлены"}
-        else:
-            print(file_location)
-            message_dict = dict()
-            if file_location.endswith(".pdf") or file_location.endswith(".docx") or file_location.endswith(".rtf"):
-                model_answer = await send_file(file_location, f"{url}")
-                if model_answer is None:
-                    raise HTTPException(403, "Сервер недостаточно точно распознал резюме")
-                if 'result' in model_answer.keys():
-                    raise HTTPException(403, "Документ не может быть разобран")
-                result.append(model_answer)
-                print(model_answer)
-                new_file = await save_files_in_db(db, file.filename, sender, user_id)
-                person = model_answer['person']
-                contact = model_answer['contact']
-                resume = await addResume(db, new_file.id, person['first_name'], person['last_name'],
-                                         person['middle_name'], person['age'], contact['email'],
-                                         contact['phone_number'], contact['telegram'], model_answer['hh-url'],
-                                         person['birth_date'], model_answer['stats']['degree'],
-                                         model_answer['stats']['experience'], model_answer['stats']['position'])
-                message_dict['experience'] = model_answer['stats']['experience']
-                message_dict['position'] = model_answer['stats']['position']
-                message_dict['degree'] = model_answer['stats']['degree']
-                #await send_to_resumer(message_dict)
-                for ach in model_answer['achievements']:
-                    await addAchievement(db, ach['description'], resume.id)
-
-                for job in model_answer['jobs']:
-                    await addCompany(db, job['job_company'], resume.id,
-                                     job['start_date'], job['end_date'],
-                                     job['job_description'], job['job_location'])
-
-                #for education in model_answer['education']:
-                #new_education = await addEducation(db, education['start_year'], education['end_year'],
-                #education['name'], education['tier'],
-                #resume.id, education['department_name'][0])  ##### КОСТЫЛЬ!!!!!!!!!!!!!!!!!!!!!!!!!!!!1
-                for stack in model_answer['stack']:
-                    new_stack = await addStack(db, stack['stack'], resume.id)
-
-                for skill in model_answer['skills']:
-                    await addSkill(db, resume.id, skill['name'], skill['type'])
-
-                await db.refresh(resume)
-                return SuccessResponse({"response": await resume.to_dict(educations=True, stacks=True,
-                                                                         companies=True, achievements=True,
-                                                                         skills=True)})
-            else:
-                raise HTTPException(403, "Файл не .pdf/.docx/.rtf")
-            #return {"message": "Файл успешно отправлен"}
-        return SuccessResponse({"result": result})
-    except Exception as e:
-        raise HTTPException(403, f"Не удалось сохранить или отправить файл: {str(e)}")
+        parse_queue.put(job.id)
+    except HTTPException:
+        # очередь заполнилась, пока грузился файл: задача уже сохранена, её заберёт requeuePendingJobs
+        # после истечения аренды
+        logger.warning("Очередь разбора заполнена, задача %s будет подхвачена повторным обходом", job.id)
+    return SuccessResponse({"job_id": job.id, "job_status": job.status}, status_code=202)
+
+
+async def getJob(db: AsyncSession, user_id: int, job_id: int) -> UploadJob:
+    """
+    Получает задачу пользователя
+    :param db:
+    :param user_id:
+    :param job_id:
+    :return:
+    """
+    job = await query_fetchone(db, select(UploadJob)
+                               .where(UploadJob.id == job_id, UploadJob.user_id == user_id), False)
+    if job is False:
+        raise HTTPException(404, "Нет такой задачи. Либо она не ваша")
+    return job
+
 
+async def jobEventStream(job: UploadJob, queue: asyncio.Queue):
+    """
+    Текущее состояние файлов задачи, затем события по мере разбора до завершения задачи
+    :param job:
+    :param queue: подписка, оформленная до чтения состояния, чтобы не потерять события между ними
+    :return:
+    """
+    try:
+        for job_file in job.files:
+            yield {"event": job_file.status, "data": json.dumps(
+                fileEvent(job_file.id, job_file.file_name, job_file.status, job_file.error, job_file.resume_id),
+                ensure_ascii=False)}
+        status = job.status
+        if status in JOB_FINISHED:
+            yield {"event": "job", "data": json.dumps({"job_status": status, "error": job.error},
+                                                      ensure_ascii=False)}
+        while status not in JOB_FINISHED:
+            try:
+                event = await asyncio.wait_for(queue.get(), JOB_EVENTS_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                # событие могло потеряться, пока реплика переподключалась к Redis, — сверяемся с БД
+                async with async_session() as db:
+                    current = (await db.execute(select(UploadJob.status, UploadJob.error)
+                                                .where(UploadJob.id == job.id))).first()
+                if current is None or current.status not in JOB_FINISHED:
+                    continue
+                event = {"event": "job", "data": json.dumps({"job_status": current.status, "error": current.error},
+                                                            ensure_ascii=False)}
+            yield event
+            if event["event"] == "job":
+                status = json.loads(event["data"])["job_status"]
+    finally:
+        job_events.unsubscribe(job.id, queue)
+
+
+async def streamJobEvents(user_id: int, job_id: int):
+    """
+    SSE-поток событий разбора задачи: queued, parsing, parsed, failed, stored по каждому файлу
+    и job при смене статуса задачи. Сессия БД закрывается до начала потока
+    :param user_id:
+    :param job_id:
+    :return:
+    """
+    queue = job_events.subscribe(job_id)
+    try:
+        async with async_session() as db:
+            job = await getJob(db, user_id, job_id)
+    except Exception:
+        job_events.unsubscribe(job_id, queue)
+        raise
+    return EventSourceResponse(jobEventStream(job, queue))
+
+
+async def getJobStatus(db: AsyncSession, user_id: int, job_id: int):
+    """
+    Статус задачи на разбор и каждого её файла
+    :param db:
+    :param user_id:
+    :param job_id:
+    :return:
+    """
+    job = await getJob(db, user_id, job_id)
+    return SuccessResponse({"job": await job.to_dict(files=True)})
+
+
+async def getJobResults(db: AsyncSession, user_id: int, job_id: int):
+    """
+    Разобранные резюме задачи
+    :param db:
+    :param user_id:
+    :param job_id:
+    :return:
+    """
+    job = await getJob(db, user_id, job_id)
+    resume_ids = [job_file.resume_id for job_file in job.files if job_file.resume_id is not None]
+    rows = (await db.execute(select(ResumeData.id, ResumeDocument.document)
+                             .outerjoin(ResumeDocument, ResumeDocument.resume_id == ResumeData.id)
+                             .where(ResumeData.id.in_(resume_ids))
+                             .order_by(ResumeData.id))).all()
+    return SuccessResponse({"job_status": job.status, "response": await fillResumeDocuments(db, rows)})
+
+
+def parseResumeProjection(fields: str = None, include: str = None):
+    """
+    Разбирает параметры fields и include: какие колонки резюме отдавать и какие связи грузить.
+    Без параметров отдаётся всё, как раньше
+    :param fields: колонки через запятую
+    :param include: связи через запятую, пустая строка — без связей
+    :return: (колонки или None, связи)
+    """
+    relations = RESUME_RELATIONS if include is None else tuple(rel for rel in include.split(",") if rel)
+    if set(relations) - set(RESUME_RELATIONS):
+        raise HTTPException(400, f"include может содержать только: {', '.join(RESUME_RELATIONS)}")
+    if fields is None:
+        return None, relations
+    columns = [column for column in fields.split(",") if column]
+    allowed = [column.key for column in ResumeData.__mapper__.column_attrs if column.key not in ResumeData.hidden]
+    if set(columns) - set(allowed):
+        raise HTTPException(400, f"fields может содержать только: {', '.join(allowed)}")
+    if "id" not in columns:
+        columns.append("id")
+    return columns, relations
+
+
+def resumeQueryOptions(fields: list = None, include: tuple = RESUME_RELATIONS) -> list:
+    """
+    Опции загрузки резюме для конкретного запроса
+    :param fields:
+    :param include:
+    :return:
+    """
+    options = [selectinload(getattr(ResumeData, rel)) for rel in include]
+    if fields is not None:
+        options.append(load_only(*[getattr(ResumeData, column) for column in fields]))
+    return options
+
+
+async def serializeResume(resume: ResumeData, include: tuple = RESUME_RELATIONS) -> dict:
+    return await resume.to_dict(**{rel: True for rel in include})
+
+
+def projectResumeDocument(document: dict, columns: list = None, include: tuple = RESUME_RELATIONS) -> dict:
+    """
+    Оставляет в документе резюме только запрошенные колонки и связи
+    :param document:
+    :param columns:
+    :param include:
+    :return:
+    """
+    return {key: value for key, value in document.items()
+            if (key in include if key in RESUME_RELATIONS else columns is None or key in columns)}
 
-@cache(expire=60 * 100)
-async def getResumeById(db: AsyncSession, resume_id: int, user_id: int):
+
+async def refreshResumeDocuments(db: AsyncSession, resume_ids: list, user_id: int = None) -> dict:
     """
-    Получает резюме пользователя
+    Пересобирает документы резюме из нормализованных таблиц и сохраняет их.
+    Вызывается при изменении связей и для резюме, у которых документа ещё нет
+    :param db:
+    :param resume_ids:
+    :param user_id: если указан, берутся только резюме этого пользователя
+    :return: {id резюме: документ}
+    """
+    query = (select(ResumeData, InputResume.user_id)
+             .join(InputResume, InputResume.id == ResumeData.resume_id)
+             .options(*resumeQueryOptions())
+             .where(ResumeData.id.in_(resume_ids), ResumeData.disabled.is_(False)))
+    if user_id is not None:
+        query = query.where(InputResume.user_id == user_id)
+    rows = (await db.execute(query)).all()
+    if not rows:
+        return {}
+    values = [{"resume_id": resume.id, "user_id": owner_id, "document": await serializeResume(resume)}
+              for resume, owner_id in rows]
+    statement = pg_insert(ResumeDocument).values(values)
+    await db.execute(statement.on_conflict_do_update(constraint="uq_resume_documents_resume_id",
+                                                     set_={"document": statement.excluded.document}))
+    await db.commit()
+    for value in values:
+        await resume_matcher.publishAdd(value["resume_id"], value["user_id"], resumeTerms(value["document"]),
+                                        value["document"].get("experience_months"))
+    await resume_cache.invalidate(*[value["resume_id"] for value in values])
+    return {value["resume_id"]: value["document"] for value in values}
+
+
+async def fillResumeDocuments(db: AsyncSession, rows: list) -> list:
+    """
+    Документы для строк (id резюме, документ) в том же порядке; отсутствующие собираются из таблиц,
+    удалённые резюме пропускаются
+    :param db:
+    :param rows:
+    :return:
+    """
+    missing = [resume_id for resume_id, document in rows if document is None]
+    built = await refreshResumeDocuments(db, missing) if missing else {}
+    documents = []
+    for resume_id, document in rows:
+        document = document if document is not None else built.get(resume_id)
+        if document is not None:
+            documents.append(document)
+    return documents
+
+
+async def getResumeById(db: AsyncSession, resume_id: int, user_id: int, fields: str = None, include: str = None):
+    """
+    Получает резюме пользователя из документа резюме. Готовый JSON кешируется по (user_id, resume_id)
     :param db:
     :param resume_id:
     :param user_id:
+    :param fields:
+    :param include:
     :return:
     """
-    resume = await query_fetchone(db, select(ResumeData)
-                                  .join(InputResume).filter(InputResume.id == ResumeData.resume_id)
-                                  .where(InputResume.user_id == user_id, ResumeData.id == resume_id))
-    return SuccessResponse({"resume": await resume.to_dict(educations=True, stacks=True, companies=True,
-                                                           achievements=True, skills=True)})
+    columns, relations = parseResumeProjection(fields, include)
+    projection = f"{fields}|{include}"
+    body, generation = await resume_cache.get(user_id, resume_id, projection)
+    if body is not None:
+        return Response(body, media_type="application/json")
+
+    document = await db.scalar(select(ResumeDocument.document)
+                               .where(ResumeDocument.resume_id == resume_id, ResumeDocument.user_id == user_id))
+    if document is None:
+        document = (await refreshResumeDocuments(db, [resume_id], user_id)).get(resume_id)
+    if document is None:
+        raise HTTPException(404, "Not found")
+    response = SuccessResponse({"resume": projectResumeDocument(document, columns, relations)})
+    await resume_cache.set(user_id, resume_id, response.body, generation, projection)
+    return response
 
 
-async def getMyResumes(db: AsyncSession, user_id: int, limit: int, offset: int):
+async def getResumesByIds(db: AsyncSession, resume_ids: list, user_id: int, fields: str = None, include: str = None):
     """
-    Получает все мои резюме
+    Получает много резюме пользователя за раз: документы читаются одним запросом с проверкой владельца,
+    недостающие собираются из таблиц одной пачкой. Ответ в порядке запроса, на месте чужих,
+    удалённых и несуществующих резюме — null, их id перечислены в not_found
+    :param db:
+    :param resume_ids:
+    :param user_id:
+    :param fields:
+    :param include:
+    :return:
+    """
+    columns, relations = parseResumeProjection(fields, include)
+    documents = dict((await db.execute(select(ResumeDocument.resume_id, ResumeDocument.document)
+                                       .where(ResumeDocument.resume_id.in_(set(resume_ids)),
+                                              ResumeDocument.user_id == user_id))).all())
+    missing = [resume_id for resume_id in set(resume_ids) if resume_id not in documents]
+    if missing:
+        documents.update(await refreshResumeDocuments(db, missing, user_id))
+    return SuccessResponse({
+        "resumes": [projectResumeDocument(documents[resume_id], columns, relations) if resume_id in documents
+                    else None for resume_id in resume_ids],
+        "not_found": [resume_id for resume_id in dict.fromkeys(resume_ids) if resume_id not in documents],
+    })
+
+
+def resumeRangeFilters(experience_from: int = None, experience_to: int = None,
+                       age_from: int = None, age_to: int = None) -> list:
+    """
+    Условия на стаж в месяцах и возраст. Возраст считается по году рождения, то есть с точностью до года
+    :return:
+    """
+    this_year = datetime.now().year
+    conditions = []
+    if experience_from is not None:
+        conditions.append(ResumeData.experience_months >= experience_from)
+    if experience_to is not None:
+        conditions.append(ResumeData.experience_months <= experience_to)
+    if age_from is not None:
+        conditions.append(ResumeData.birth_year <= this_year - age_from)
+    if age_to is not None:
+        conditions.append(ResumeData.birth_year >= this_year - age_to)
+    return conditions
+
+
+async def getMyResumes(db: AsyncSession, user_id: int, limit: int, offset: int, cursor: str = None,
+                       fields: str = None, include: str = None, experience_from: int = None,
+                       experience_to: int = None, age_from: int = None, age_to: int = None, order: str = "new"):
+    """
+    Получает все мои резюме. С cursor листает по ключу (id резюме или стаж и id) без offset,
+    next_cursor отдаётся в ответе, пока есть следующая страница.
+    Резюме отдаются из документов, fields и include ограничивают колонки и связи в ответе
     :param db:
     :param user_id:
     :param limit:
     :param offset:
+    :param cursor:
+    :param fields:
+    :param include:
+    :param experience_from: стаж от, в месяцах
+    :param experience_to: стаж до, в месяцах
+    :param age_from:
+    :param age_to:
+    :param order: new — сначала новые, experience — по убыванию стажа, резюме без распознанного стажа не попадают
     :return:
     """
-    resumes = await query_fetchall(db, select(ResumeData)
-                                   .join(InputResume).filter(InputResume.id == ResumeData.resume_id)
-                                   .where(InputResume.user_id == user_id)
-                                   .limit(limit).offset(offset).order_by(ResumeData.id.desc()))
-    print(resumes)
-    return SuccessResponse({"resumes": [
-        await resume[0].to_dict(educations=True, stacks=True, companies=True, achievements=True, skills=True) for resume
-        in resumes]})
+    if order not in RESUME_ORDERS:
+        raise HTTPException(400, f"Неизвестная сортировка {order}, доступны: {', '.join(RESUME_ORDERS)}")
+    columns, relations = parseResumeProjection(fields, include)
+    query = (select(ResumeData.id, ResumeDocument.document, ResumeData.experience_months)
+             .join(InputResume).filter(InputResume.id == ResumeData.resume_id)
+             .outerjoin(ResumeDocument, ResumeDocument.resume_id == ResumeData.id)
+             .where(InputResume.user_id == user_id, ResumeData.disabled.is_(False),
+                    *resumeRangeFilters(experience_from, experience_to, age_from, age_to))
+             # лишняя строка показывает, есть ли следующая страница
+             .limit(limit + 1))
+    if order == "experience":
+        query = (query.where(ResumeData.experience_months.isnot(None))
+                 .order_by(ResumeData.experience_months.desc(), ResumeData.id.desc()))
+    else:
+        query = query.order_by(ResumeData.id.desc())
+    if cursor is not None:
+        position = decode_cursor(cursor)
+        cursor_id = position.get("id")
+        if not isinstance(cursor_id, int):
+            raise HTTPException(400, "Неверный курсор")
+        if order == "experience":
+            cursor_experience = position.get("experience")
+            if not isinstance(cursor_experience, int):
+                raise HTTPException(400, "Неверный курсор")
+            query = query.where(tuple_(ResumeData.experience_months, ResumeData.id) < (cursor_experience, cursor_id))
+        else:
+            query = query.where(ResumeData.id < cursor_id)
+    else:
+        query = query.offset(offset)
+    rows = (await db.execute(query)).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last_id, _, last_experience = rows[-1]
+        next_cursor = encode_cursor(experience=last_experience, id=last_id) if order == "experience" \
+            else encode_cursor(id=last_id)
+    documents = await fillResumeDocuments(db, [(resume_id, document) for resume_id, document, _ in rows])
+    return SuccessResponse({"resumes": [projectResumeDocument(document, columns, relations)
+                                        for document in documents],
+                            "next_cursor": next_cursor})
 
 
 async def deleteById(db: AsyncSession, user_id: int, resume_id: int):
     """
-    Удаляет из базы данных(в основном полезно если неправильно сгенерил)
+    Удаляет резюме (в основном полезно если неправильно сгенерил): помечает disabled и сразу убирает
+    из выдачи, строки из БД удаляет фоновая очистка (см. src/resumes/purge.py)
     :param db:
     :param user_id:
     :param resume_id:
     :return:
     """
-    resume = await query_fetchone(db, select(ResumeData)
-                                  .join(InputResume).filter(InputResume.id == ResumeData.resume_id)
-                                  .where(InputResume.user_id == user_id, ResumeData.id == resume_id), False)
-    if resume is False:
+    resume = (await db.execute(select(ResumeData.id, InputResume.sender)
+                               .join(InputResume).filter(InputResume.id == ResumeData.resume_id)
+                               .where(InputResume.user_id == user_id, ResumeData.id == resume_id, ResumeData.disabled.is_(False)))).first()
+    if resume is None:
         raise HTTPException(404, "Нет такого резюме. Либо оно не ваше")
 
-    await db.execute(delete(ResumeData).where(ResumeData.id == resume_id))
+    await removeResumeFacets(db, [resume_id])
+    await changeResumeCounts(db, [(user_id, resume.sender)], -1)
+    await db.execute(delete(ResumeDocument).where(ResumeDocument.resume_id == resume_id))
+    await db.execute(update(ResumeData).where(ResumeData.id == resume_id).values(disabled=True))
     await db.commit()
+    await resume_cache.invalidate(resume_id)
+    await resume_matcher.publishRemove(resume_id)
     return SuccessResponse()
 
 
+async def getOriginal(db: AsyncSession, user_id: int, resume_id: int):
+    """
+    Отдаёт исходный файл резюме из file-server
+    :param db:
+    :param user_id:
+    :param resume_id:
+    :return:
+    """
+    original = (await db.execute(select(InputResume.link, InputResume.file_name)
+                                 .join(ResumeData, ResumeData.resume_id == InputResume.id)
+                                 .where(InputResume.user_id == user_id, ResumeData.id == resume_id,
+                                        ResumeData.disabled.is_(False)))).first()
+    if original is None:
+        raise HTTPException(404, "Нет такого резюме. Либо оно не ваше")
+    if original.link is None:
+        raise HTTPException(404, "Исходный файл этого резюме не сохранён")
+    return await file_storage.stream(original.link, os.path.basename(original.file_name))
+
+
+async def getDuplicates(db: AsyncSession, user_id: int, resume_id: int):
+    """
+    Резюме того же кандидата (совпал email, телефон или telegram) среди резюме пользователя
+    :param db:
+    :param user_id:
+    :param resume_id:
+    :return:
+    """
+    candidate_id = await db.scalar(select(candidateKey())
+                                   .join(InputResume, InputResume.id == ResumeData.resume_id)
+                                   .where(InputResume.user_id == user_id, ResumeData.id == resume_id, ResumeData.disabled.is_(False)))
+    if candidate_id is None:
+        raise HTTPException(404, "Нет такого резюме. Либо оно не ваше")
+
+    rows = (await db.execute(select(ResumeData.id, ResumeDocument.document, InputResume.sender)
+                             .join(InputResume, InputResume.id == ResumeData.resume_id)
+                             .outerjoin(ResumeDocument, ResumeDocument.resume_id == ResumeData.id)
+                             .where(or_(ResumeData.candidate_id == candidate_id, ResumeData.id == candidate_id),
+                                    ResumeData.id != resume_id, InputResume.user_id == user_id, ResumeData.disabled.is_(False))
+                             .order_by(ResumeData.id.desc()))).all()
+    senders = {row.id: row.sender for row in rows}
+    documents = await fillResumeDocuments(db, [(row.id, row.document) for row in rows])
+    return SuccessResponse({"duplicates": [{**projectResumeDocument(document, include=()),
+                                            "sender": senders[document['id']]} for document in documents]})
+
+
 async def get_all_resumes_count(db: AsyncSession):
     """
-    Получить общее количество резюме(для главной страницы)
+    Получить общее количество резюме(для главной страницы), читается из счётчика
     :param db:
     :return:
     """
-    total_count = await db.scalar(
-        select(func.count()).select_from(ResumeData)
-    )
+    total_count = await getResumeCount(db, "all")
     return SuccessResponse({"count": str(total_count) + " "})
 
 
+async def getMyResumesCount(db: AsyncSession, user_id: int):
+    """
+    Количество моих резюме и всех резюме по источникам
+    :param db:
+    :param user_id:
+    :return:
+    """
+    return SuccessResponse({"count": await getResumeCount(db, "user", str(user_id)),
+                            "senders": await getResumeCounts(db, "sender")})
+
+
+def ownedResumeIds(user_id: int, resume_ids):
+    """
+    Подзапрос id неудалённых резюме пользователя из списка
+    :param user_id:
+    :param resume_ids:
+    :return:
+    """
+    return (select(literal(user_id), ResumeData.id)
+            .join(InputResume, InputResume.id == ResumeData.resume_id)
+            .where(ResumeData.id.in_(set(resume_ids)), InputResume.user_id == user_id,
+                   ResumeData.disabled.is_(False)))
+
+
 async def addToFavorite(db: AsyncSession, user_id: int, resume_id: int):
     """
     Добавить в избранное
@@ -393,34 +1022,81 @@ async def addToFavorite(db: AsyncSession, user_id: int, resume_id: int):
     :param resume_id:
     :return:
     """
-    old_favorite = await query_fetchone(db, select(Favorite)
-                                        .where(Favorite.user_id == user_id, Favorite.resume_id == resume_id).limit(1),
-                                        False)
-    if old_favorite is not False:
+    if await db.scalar(ownedResumeIds(user_id, [resume_id])) is None:
+        raise HTTPException(404, "Нет такого резюме. Либо оно не ваше")
+    favorite = await db.scalar(pg_insert(Favorite).values(user_id=user_id, resume_id=resume_id)
+                               .on_conflict_do_nothing(constraint="uq_favorites_user_id_resume_id")
+                               .returning(Favorite))
+    if favorite is None:
         raise HTTPException(403, "Уже в избранном")
-    favorite = Favorite(user_id=user_id, resume_id=resume_id)
-    db.add(favorite)
     await db.commit()
-    await db.refresh(favorite)
     return SuccessResponse({"favorite": await favorite.to_dict()})
 
 
-async def getMyFavorites(db: AsyncSession, user_id: int):
+async def addFavorites(db: AsyncSession, user_id: int, resume_ids: list):
     """
-    Получает избранные пользователя
+    Добавляет в избранное сразу много резюме одним запросом.
+    Уже добавленные, чужие и несуществующие резюме пропускаются
     :param db:
     :param user_id:
-    :return:
+    :param resume_ids:
+    :return: id добавленных резюме
     """
-    favorites = await query_fetchall(db, select(ResumeData).join(Favorite)
-                                     .where(Favorite.user_id == user_id)
-                                     .order_by(Favorite.id.desc()), False)
-    if favorites is False:
-        return SuccessResponse({"favorites": []})
+    statement = (pg_insert(Favorite)
+                 .from_select(["user_id", "resume_id"], ownedResumeIds(user_id, resume_ids))
+                 .on_conflict_do_nothing(constraint="uq_favorites_user_id_resume_id")
+                 .returning(Favorite.resume_id))
+    added = (await db.scalars(statement)).all()
+    await db.commit()
+    return SuccessResponse({"added": sorted(added)})
+
+
+async def removeFavorites(db: AsyncSession, user_id: int, resume_ids: list):
+    """
+    Удаляет из избранного сразу много резюме одним запросом
+    :param db:
+    :param user_id:
+    :param resume_ids:
+    :return: id удалённых резюме
+    """
+    removed = (await db.scalars(delete(Favorite)
+                                .where(Favorite.user_id == user_id, Favorite.resume_id.in_(set(resume_ids)))
+                                .returning(Favorite.resume_id))).all()
+    await db.commit()
+    return SuccessResponse({"removed": sorted(removed)})
 
-    return SuccessResponse({"favorites": [
-        await favorite[0].to_dict(educations=True, stacks=True, companies=True, achievements=True) for favorite in
-        favorites]})
+
+async def getMyFavorites(db: AsyncSession, user_id: int, limit: int, cursor: str = None):
+    """
+    Получает избранные пользователя, последние добавленные первыми.
+    Листается по курсору, next_cursor отдаётся в ответе, пока есть следующая страница
+    :param db:
+    :param user_id:
+    :param limit:
+    :param cursor:
+    :return:
+    """
+    query = (select(Favorite.id, Favorite.resume_id, ResumeDocument.document)
+             .join(ResumeData, ResumeData.id == Favorite.resume_id)
+             .join(InputResume, InputResume.id == ResumeData.resume_id)
+             .outerjoin(ResumeDocument, ResumeDocument.resume_id == Favorite.resume_id)
+             .where(Favorite.user_id == user_id, InputResume.user_id == user_id, ResumeData.disabled.is_(False))
+             .order_by(Favorite.id.desc()).limit(limit + 1))
+    if cursor is not None:
+        cursor_id = decode_cursor(cursor).get("id")
+        if not isinstance(cursor_id, int):
+            raise HTTPException(400, "Неверный курсор")
+        query = query.where(Favorite.id < cursor_id)
+    rows = (await db.execute(query)).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(id=rows[-1][0])
+    documents = await fillResumeDocuments(db, [(resume_id, document) for favorite_id, resume_id, document in rows])
+    relations = ("educations", "stacks", "companies", "achievements")
+    return SuccessResponse({"favorites": [projectResumeDocument(document, include=relations)
+                                          for document in documents],
+                            "next_cursor": next_cursor})
 
 
 async def deleteFromFavorites(db: AsyncSession, user_id: int, resume_id: int):
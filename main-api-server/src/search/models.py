@@ -0,0 +1,29 @@
+from sqlalchemy import Column, String, Integer, ForeignKey, Index, UniqueConstraint
+
+from src.AbstractModel import AbstractModel
+
+
+class ResumeFacet(AbstractModel):
+    __tablename__ = "resume_facets"
+    # инвертированный индекс фасетов: одна строка на значение фасета в резюме
+    __table_args__ = (
+        Index("ix_resume_facets_user_facet_value", "user_id", "facet", "value", "resume_id"),
+    )
+
+    resume_id = Column(Integer, ForeignKey("resumes_data.id"), index=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    facet = Column(String, nullable=False)
+    value = Column(String, nullable=False)
+
+
+class FacetCount(AbstractModel):
+    __tablename__ = "facet_counts"
+    # сколько резюме пользователя с этим значением фасета, обновляется при сохранении и удалении резюме
+    __table_args__ = (
+        UniqueConstraint("user_id", "facet", "value", name="uq_facet_counts_user_facet_value"),
+    )
+
+    user_id = Column(Integer, ForeignKey("users.id"))
+    facet = Column(String, nullable=False)
+    value = Column(String, nullable=False)
+    count = Column(Integer, nullable=False, server_default="0")
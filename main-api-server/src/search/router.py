@@ -0,0 +1,24 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.database import get_session
+from src.jwt_handler import verify_token_and_check_role_hiring_manager_and_recruiter
+from src.search.schemas import FacetFilter
+from src.search.service import searchResumes, browseFacets
+
+search_router = APIRouter(prefix="/search", tags=["Search"])
+
+
+@search_router.get("/resumes", summary="Поиск по моим резюме")
+async def search_resumes(q: str = Query(..., max_length=200), limit: int = Query(20, ge=1, le=100),
+                         offset: int = Query(0, ge=0),
+                         token=Depends(verify_token_and_check_role_hiring_manager_and_recruiter),
+                         db: AsyncSession = Depends(get_session)):
+    return await searchResumes(db, token['id'], q, limit, offset)
+
+
+@search_router.post("/facets", summary="Фильтр моих резюме по стеку, навыкам, уровню и должности с количеством")
+async def browse_facets(data: FacetFilter,
+                        token=Depends(verify_token_and_check_role_hiring_manager_and_recruiter),
+                        db: AsyncSession = Depends(get_session)):
+    return await browseFacets(db, token['id'], data)
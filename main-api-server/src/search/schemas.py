@@ -0,0 +1,12 @@
+from typing import List
+
+from pydantic import BaseModel, Field
+
+
+class FacetFilter(BaseModel):
+    stack: List[str] = []
+    skill: List[str] = []
+    degree: List[str] = []
+    position: List[str] = []
+    limit: int = Field(20, ge=1, le=100)
+    offset: int = Field(0, ge=0)
@@ -0,0 +1,329 @@
+import asyncio
+import logging
+import os
+from collections import Counter, defaultdict
+
+from fastapi import HTTPException
+from sqlalchemy import select, func, literal, update, cast, String, insert, delete, tuple_, intersect
+from sqlalchemy.dialects.postgresql import REGCONFIG, insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from database.database import async_session
+from src.exceptions import SuccessResponse
+from src.resumes.counters import getResumeCount
+from src.resumes.models import ResumeData, InputResume, Stack, Skill
+from src.search.models import ResumeFacet, FacetCount
+from src.search.schemas import FacetFilter
+from src.terms.service import term_dictionary, TERM_FACETS
+
+logger = logging.getLogger(__name__)
+
+SEARCH_CONFIG = cast("russian", REGCONFIG)
+SEARCH_HEADLINE_OPTIONS = "MaxFragments=2, MaxWords=20, MinWords=5, StartSel=<b>, StopSel=</b>"
+SEARCH_BACKFILL_BATCH = int(os.getenv("SEARCH_BACKFILL_BATCH", 1000))
+FACETS = ("stack", "skill", "degree", "position")
+# фасеты из словаря терминов фильтруются по term_id записей стека и навыков
+TERM_FACET_MODELS = {"stack": Stack, "skill": Skill}
+FACET_VALUES_LIMIT = int(os.getenv("FACET_VALUES_LIMIT", 50))
+
+
+def searchDocument(resume: dict):
+    """
+    Собирает текст для поиска из резюме (колонки + дочерние записи, как в to_dict)
+    :param resume:
+    :return: (search_title, search_text)
+    """
+    title = [resume.get('last_name'), resume.get('first_name'), resume.get('middle_name'),
+             resume.get('position'), resume.get('degree')]
+    title += [stack['stack'] for stack in resume.get('stacks', [])]
+    title += [skill['name'] for skill in resume.get('skills', [])]
+    text = []
+    for company in resume.get('companies', []):
+        text += [company.get('name'), company.get('position'), company.get('job_description')]
+    text += [achievement['description'] for achievement in resume.get('achievements', [])]
+    return (" ".join(part for part in title if part and part != "None"),
+            " ".join(part for part in text if part))
+
+
+async def searchResumes(db: AsyncSession, user_id: int, q: str, limit: int, offset: int):
+    """
+    Полнотекстовый поиск по моим резюме с ранжированием и подсветкой.
+    Если полнотекстовый поиск ничего не нашёл (опечатки, обрывки слов), ищет по триграммам
+    :param db:
+    :param user_id:
+    :param q:
+    :param limit:
+    :param offset:
+    :return:
+    """
+    q = q.strip()
+    if not q:
+        raise HTTPException(400, "Пустой поисковый запрос")
+
+    ts_query = func.websearch_to_tsquery(SEARCH_CONFIG, q)
+    rank = func.ts_rank_cd(ResumeData.search_vector, ts_query)
+    # сначала страница id по индексу, ts_headline дорогой — считаем его только для неё
+    ranked = (select(ResumeData.id, rank.label("rank"))
+              .join(InputResume, InputResume.id == ResumeData.resume_id)
+              .where(InputResume.user_id == user_id, ResumeData.disabled.is_(False),
+                     ResumeData.search_vector.op("@@")(ts_query))
+              .order_by(rank.desc(), ResumeData.id.desc())
+              .limit(limit).offset(offset)
+              .subquery())
+    headline = func.ts_headline(SEARCH_CONFIG, func.concat_ws(" ", ResumeData.search_title, ResumeData.search_text),
+                                ts_query, SEARCH_HEADLINE_OPTIONS)
+    rows = (await db.execute(select(ResumeData, ranked.c.rank, headline.label("highlight"))
+                             .join(ranked, ranked.c.id == ResumeData.id)
+                             .order_by(ranked.c.rank.desc(), ResumeData.id.desc()))).all()
+    match = "fulltext"
+
+    if not rows and offset == 0:
+        similarity = func.word_similarity(q, ResumeData.search_title)
+        rows = (await db.execute(select(ResumeData, similarity.label("rank"), literal(None).label("highlight"))
+                                 .join(InputResume, InputResume.id == ResumeData.resume_id)
+                                 .where(InputResume.user_id == user_id, ResumeData.disabled.is_(False),
+                                        literal(q, String).op("<%")(ResumeData.search_title))
+                                 .order_by(similarity.desc(), ResumeData.id.desc())
+                                 .limit(limit))).all()
+        match = "trigram"
+
+    return SuccessResponse({"match": match, "resumes": [
+        {"resume": await resume.to_dict(), "rank": float(resume_rank), "highlight": highlight}
+        for resume, resume_rank, highlight in rows]})
+
+
+async def backfillSearchIndex(batch_size: int = SEARCH_BACKFILL_BATCH):
+    """
+    Заполняет поисковый текст у резюме, сохранённых до появления поиска, пачками
+    :param batch_size:
+    :return: сколько резюме проиндексировано
+    """
+    total = 0
+    while True:
+        async with async_session() as db:
+            resumes = (await db.scalars(select(ResumeData)
+                                        .options(selectinload(ResumeData.stacks), selectinload(ResumeData.skills),
+                                                 selectinload(ResumeData.companies),
+                                                 selectinload(ResumeData.achievements))
+                                        .where(ResumeData.search_title.is_(None))
+                                        .order_by(ResumeData.id).limit(batch_size))).all()
+            if not resumes:
+                break
+            rows = []
+            for resume in resumes:
+                search_title, search_text = searchDocument(
+                    await resume.to_dict(stacks=True, skills=True, companies=True, achievements=True))
+                rows.append({"id": resume.id, "search_title": search_title, "search_text": search_text})
+            await db.execute(update(ResumeData), rows)
+            await db.commit()
+            total += len(rows)
+        await asyncio.sleep(0)
+    if total:
+        logger.info("Поисковый индекс заполнен для %s резюме", total)
+    return total
+
+
+def facetValues(resume: dict) -> set:
+    """
+    Значения фасетов резюме (колонки + дочерние записи, как в to_dict).
+    Стек и навыки приводятся к каноническим названиям словаря, чтобы все написания попадали в одно значение
+    :param resume:
+    :return: {(фасет, значение)}
+    """
+    items = {
+        "stack": [term_dictionary.canonical(stack['stack']) for stack in resume.get('stacks', [])],
+        "skill": [term_dictionary.canonical(skill['name']) for skill in resume.get('skills', [])],
+        "degree": [resume.get('degree')],
+        "position": [resume.get('position')],
+    }
+    return {(facet, value.strip()) for facet, values in items.items() for value in values
+            if value and value.strip() and value != "None"}
+
+
+async def indexResumeFacets(db: AsyncSession, resume_id: int, user_id: int, resume: dict):
+    """
+    Записывает фасеты резюме и увеличивает счётчики. Без commit — выполняется в транзакции сохранения резюме.
+    Счётчики обновляются в порядке (facet, value), чтобы параллельные загрузки брали блокировки
+    в одном порядке и не попадали в deadlock
+    :param db:
+    :param resume_id:
+    :param user_id:
+    :param resume:
+    :return:
+    """
+    values = sorted(facetValues(resume))
+    if not values:
+        return
+    await db.execute(insert(ResumeFacet), [{"resume_id": resume_id, "user_id": user_id, "facet": facet, "value": value}
+                                           for facet, value in values])
+    await addFacetCounts(db, Counter((user_id, facet, value) for facet, value in values))
+
+
+async def removeResumeFacets(db: AsyncSession, resume_ids: list):
+    """
+    Удаляет фасеты резюме и уменьшает счётчики. Без commit — выполняется в транзакции удаления.
+    Строки счётчиков сначала блокируются в порядке (user_id, facet, value), как при сохранении резюме
+    :param db:
+    :param resume_ids:
+    :return:
+    """
+    rows = (await db.execute(select(ResumeFacet.user_id, ResumeFacet.facet, ResumeFacet.value)
+                             .where(ResumeFacet.resume_id.in_(resume_ids)))).all()
+    if not rows:
+        return
+    await db.execute(delete(ResumeFacet).where(ResumeFacet.resume_id.in_(resume_ids)))
+    await db.execute(select(FacetCount.id)
+                     .where(tuple_(FacetCount.user_id, FacetCount.facet, FacetCount.value).in_(set(map(tuple, rows))))
+                     .order_by(FacetCount.user_id, FacetCount.facet, FacetCount.value)
+                     .with_for_update())
+    # одно и то же значение может быть у нескольких удаляемых резюме: группируем по величине уменьшения
+    by_delta = defaultdict(list)
+    for key, delta in Counter(tuple(row) for row in rows).items():
+        by_delta[delta].append(key)
+    for delta, keys in by_delta.items():
+        await db.execute(update(FacetCount)
+                         .where(tuple_(FacetCount.user_id, FacetCount.facet, FacetCount.value).in_(keys))
+                         .values(count=FacetCount.count - delta))
+
+
+def resolveFacets(selected: dict) -> dict:
+    """
+    Переводит выбранные значения фасетов из словаря терминов в id терминов, любое написание даёт тот же id.
+    Значения, которых нет в словаре, отбрасываются — такой фасет ничего не найдёт
+    :param selected: {фасет: [значения]}
+    :return: {фасет: [значения или id терминов]}
+    """
+    return {facet: [term_id for term_id in map(term_dictionary.lookup, values) if term_id is not None]
+            if facet in TERM_FACETS else values
+            for facet, values in selected.items()}
+
+
+def facetMatch(user_id: int, facet: str, values: list):
+    if facet not in TERM_FACET_MODELS:
+        return (select(ResumeFacet.resume_id)
+                .where(ResumeFacet.user_id == user_id, ResumeFacet.facet == facet, ResumeFacet.value.in_(values)))
+    model = TERM_FACET_MODELS[facet]
+    # у резюме может быть несколько записей с одним термином (python3 и Python)
+    return (select(model.resume_id).distinct()
+            .join(ResumeData, ResumeData.id == model.resume_id)
+            .join(InputResume, InputResume.id == ResumeData.resume_id)
+            .where(model.term_id.in_(values), InputResume.user_id == user_id, ResumeData.disabled.is_(False)))
+
+
+def facetMatches(user_id: int, selected: dict):
+    """
+    Подзапрос id резюме пользователя с выбранными значениями фасетов:
+    внутри фасета значения через ИЛИ, разные фасеты — через И.
+    Стек и навыки ищутся по индексу term_id, остальные фасеты — по resume_facets
+    :param user_id:
+    :param selected: {фасет: [значения]}, см. resolveFacets
+    :return:
+    """
+    return intersect(*[facetMatch(user_id, facet, values) for facet, values in selected.items()]).subquery()
+
+
+def topFacetValues(counts):
+    """
+    Оставляет FACET_VALUES_LIMIT самых частых значений каждого фасета
+    :param counts: подзапрос с колонками facet, value, count
+    :return:
+    """
+    place = func.row_number().over(partition_by=counts.c.facet,
+                                   order_by=(counts.c.count.desc(), counts.c.value)).label("place")
+    ranked = select(counts.c.facet, counts.c.value, counts.c.count, place).subquery()
+    return (select(ranked.c.facet, ranked.c.value, ranked.c.count)
+            .where(ranked.c.place <= FACET_VALUES_LIMIT)
+            .order_by(ranked.c.facet, ranked.c.place))
+
+
+async def browseFacets(db: AsyncSession, user_id: int, filters: FacetFilter):
+    """
+    Мои резюме, отфильтрованные по значениям фасетов, и количество резюме по каждому значению.
+    Внутри фасета значения объединяются через ИЛИ, разные фасеты — через И.
+    Без фильтров счётчики берутся из facet_counts и resume_counts, с фильтрами — из инвертированного индекса resume_facets
+    :param db:
+    :param user_id:
+    :param filters:
+    :return:
+    """
+    selected = resolveFacets({facet: getattr(filters, facet) for facet in FACETS if getattr(filters, facet)})
+    resumes_query = (select(ResumeData).order_by(ResumeData.id.desc())
+                     .limit(filters.limit).offset(filters.offset))
+    if selected:
+        matching = facetMatches(user_id, selected)
+        matching_ids = select(matching.c.resume_id)
+        total = await db.scalar(select(func.count()).select_from(matching))
+        counts = (select(ResumeFacet.facet, ResumeFacet.value, func.count().label("count"))
+                  .where(ResumeFacet.user_id == user_id, ResumeFacet.resume_id.in_(matching_ids))
+                  .group_by(ResumeFacet.facet, ResumeFacet.value).subquery())
+        resumes_query = resumes_query.where(ResumeData.id.in_(matching_ids))
+    else:
+        total = await getResumeCount(db, "user", str(user_id))
+        counts = (select(FacetCount.facet, FacetCount.value, FacetCount.count)
+                  .where(FacetCount.user_id == user_id, FacetCount.count > 0).subquery())
+        resumes_query = (resumes_query.join(InputResume, InputResume.id == ResumeData.resume_id)
+                         .where(InputResume.user_id == user_id, ResumeData.disabled.is_(False)))
+
+    facets = {facet: [] for facet in FACETS}
+    for facet, value, count in (await db.execute(topFacetValues(counts))).all():
+        facets[facet].append({"value": value, "count": count})
+    resumes = (await db.scalars(resumes_query)).all()
+    return SuccessResponse({"total": total, "facets": facets,
+                            "resumes": [await resume.to_dict() for resume in resumes]})
+
+
+async def backfillFacets(batch_size: int = SEARCH_BACKFILL_BATCH):
+    """
+    Строит фасеты для резюме, сохранённых до их появления (facets_indexed = false), и прибавляет
+    их к facet_counts. Счётчики не пересчитываются целиком, поэтому параллельные загрузки не теряют свои
+    приращения, а резюме без значений фасетов отмечаются и больше не сканируются
+    :param batch_size:
+    :return: сколько резюме проиндексировано
+    """
+    total = 0
+    while True:
+        async with async_session() as db:
+            rows = (await db.execute(select(ResumeData, InputResume.user_id)
+                                     .join(InputResume, InputResume.id == ResumeData.resume_id)
+                                     .options(selectinload(ResumeData.stacks), selectinload(ResumeData.skills))
+                                     .where(ResumeData.facets_indexed.is_(False), ResumeData.disabled.is_(False))
+                                     .order_by(ResumeData.id).limit(batch_size))).all()
+            if not rows:
+                break
+            resume_ids = [resume.id for resume, _ in rows]
+            # фасеты могли появиться в обход отметки — их не дублируем
+            indexed = set((await db.scalars(select(ResumeFacet.resume_id).distinct()
+                                            .where(ResumeFacet.resume_id.in_(resume_ids)))).all())
+            facet_rows = []
+            for resume, user_id in rows:
+                if resume.id in indexed:
+                    continue
+                values = facetValues(await resume.to_dict(stacks=True, skills=True))
+                facet_rows += [{"resume_id": resume.id, "user_id": user_id, "facet": facet, "value": value}
+                               for facet, value in values]
+            if facet_rows:
+                await db.execute(insert(ResumeFacet), facet_rows)
+                await addFacetCounts(db, Counter((row["user_id"], row["facet"], row["value"])
+                                                 for row in facet_rows))
+            await db.execute(update(ResumeData).where(ResumeData.id.in_(resume_ids)).values(facets_indexed=True))
+            await db.commit()
+            total += len(rows)
+        await asyncio.sleep(0)
+    if total:
+        logger.info("Фасеты построены для %s резюме", total)
+    return total
+
+
+async def addFacetCounts(db: AsyncSession, deltas: Counter):
+    """
+    Прибавляет приращения к facet_counts в порядке (user_id, facet, value), как при сохранении резюме.
+    Без commit
+    :param db:
+    :param deltas: {(user_id, facet, value): приращение}
+    :return:
+    """
+    statement = pg_insert(FacetCount).values([{"user_id": user_id, "facet": facet, "value": value, "count": count}
+                                              for (user_id, facet, value), count in sorted(deltas.items())])
+    await db.execute(statement.on_conflict_do_update(constraint="uq_facet_counts_user_facet_value",
+                                                     set_={"count": FacetCount.count + statement.excluded.count}))
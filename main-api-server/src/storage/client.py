@@ -0,0 +1,199 @@
+import datetime
+import hashlib
+import os
+import tempfile
+import uuid
+from urllib.parse import quote
+
+import httpx
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import StreamingResponse
+
+from src.jwt_handler import generate_jwt_token
+
+load_dotenv()
+
+FILE_SERVER_URL = os.getenv("FILE_SERVER_URL", "http://localhost:8002")
+FILE_SERVER_TIMEOUT = float(os.getenv("FILE_SERVER_TIMEOUT", 300))
+FILE_SERVER_CONNECT_TIMEOUT = float(os.getenv("FILE_SERVER_CONNECT_TIMEOUT", 5))
+FILE_SERVER_CONNECTIONS = int(os.getenv("FILE_SERVER_CONNECTIONS", 16))
+# скачанный файл держится в памяти, пока не больше этого размера, дальше уходит во временный файл
+FILE_SPOOL_SIZE = int(os.getenv("FILE_SPOOL_SIZE", 16 * 1024 * 1024))
+FILE_UPLOAD_CHUNK_SIZE = int(os.getenv("FILE_UPLOAD_CHUNK_SIZE", 1024 * 1024))
+SERVICE_TOKEN_TTL = datetime.timedelta(minutes=5)
+
+
+class HashingReader:
+    """
+    Асинхронный итератор по файлу для загрузки в file-server: читает файл кусками в пуле потоков,
+    чтобы не блокировать event loop, по пути считает sha256 и размер, обрывает загрузку больше max_size
+    """
+
+    def __init__(self, file, max_size: int, chunk_size: int = FILE_UPLOAD_CHUNK_SIZE):
+        self.file = file
+        self.max_size = max_size
+        self.chunk_size = chunk_size
+        self.size = 0
+        self.hasher = hashlib.sha256()
+
+    async def __aiter__(self):
+        while True:
+            chunk = await run_in_threadpool(self.file.read, self.chunk_size)
+            if not chunk:
+                break
+            self.size += len(chunk)
+            if self.size > self.max_size:
+                raise HTTPException(413, "Размер файла превышен")
+            self.hasher.update(chunk)
+            yield chunk
+
+    def hexdigest(self) -> str:
+        return self.hasher.hexdigest()
+
+
+async def multipartBody(boundary: str, filename: str, file):
+    """
+    Тело multipart/form-data с одним полем file. httpx читает файловые объекты синхронно,
+    поэтому тело собирается вручную из bytes или асинхронного итератора
+    :param boundary:
+    :param filename:
+    :param file: bytes или асинхронный итератор кусков
+    :return:
+    """
+    filename = filename.replace("\\", "\\\\").replace('"', "%22").replace("\r", "%0D").replace("\n", "%0A")
+    yield (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+           f'Content-Type: application/octet-stream\r\n\r\n').encode()
+    if isinstance(file, bytes):
+        yield file
+    else:
+        async for chunk in file:
+            yield chunk
+    yield f"\r\n--{boundary}--\r\n".encode()
+
+
+class FileStorageClient:
+    """
+    Клиент file-server, где лежат оригиналы резюме: загрузка потоком, скачивание, отдача клиенту и удаление.
+    Запросы подписываются короткоживущим сервисным JWT от имени пользователя
+    """
+
+    def __init__(self, url: str = FILE_SERVER_URL, timeout: float = FILE_SERVER_TIMEOUT,
+                 connections: int = FILE_SERVER_CONNECTIONS):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.connections = connections
+        self.client = None
+
+    async def start(self):
+        """
+        Создаёт пул соединений, вызывается один раз на старте приложения
+        :return:
+        """
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(self.timeout, connect=FILE_SERVER_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=self.connections, max_keepalive_connections=self.connections),
+        )
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    def _check_started(self):
+        if self.client is None:
+            raise HTTPException(503, "Клиент file-server не запущен")
+
+    async def _headers(self, user_id: int) -> dict:
+        token = await generate_jwt_token({"id": user_id, "role": "service"}, SERVICE_TOKEN_TTL)
+        return {"Authorization": f"Bearer {token}"}
+
+    async def upload(self, user_id: int, filename: str, file) -> str:
+        """
+        Загружает файл в file-server, читая его кусками
+        :param user_id:
+        :param filename:
+        :param file: bytes или асинхронный итератор кусков (HashingReader)
+        :return: хеш файла в file-server
+        """
+        self._check_started()
+        boundary = uuid.uuid4().hex
+        headers = {**await self._headers(user_id), "Content-Type": f"multipart/form-data; boundary={boundary}"}
+        try:
+            response = await self.client.post(f"{self.url}/files/upload", headers=headers,
+                                              content=multipartBody(boundary, os.path.basename(filename), file))
+        except httpx.TimeoutException as e:
+            raise HTTPException(504, f"file-server не ответил вовремя: {str(e)}")
+        except httpx.TransportError as e:
+            raise HTTPException(502, f"file-server недоступен: {str(e)}")
+        if response.status_code != 200:
+            raise HTTPException(response.status_code, f"file-server не принял файл: {response.text}")
+        return response.json()["file"].rsplit("/", 1)[-1]
+
+    async def delete(self, user_id: int, link: str):
+        """
+        Удаляет файл пользователя из file-server, уже удалённый файл ошибкой не считается
+        :param user_id: владелец файла
+        :param link: хеш файла в file-server
+        :return:
+        """
+        self._check_started()
+        try:
+            response = await self.client.delete(f"{self.url}/files/{link}", headers=await self._headers(user_id))
+        except httpx.TimeoutException as e:
+            raise HTTPException(504, f"file-server не ответил вовремя: {str(e)}")
+        except httpx.TransportError as e:
+            raise HTTPException(502, f"file-server недоступен: {str(e)}")
+        if response.status_code not in (200, 404):
+            raise HTTPException(502, f"file-server не удалил файл: {response.text}")
+
+    async def _open(self, link: str) -> httpx.Response:
+        self._check_started()
+        try:
+            response = await self.client.send(self.client.build_request("GET", f"{self.url}/files/{link}"),
+                                              stream=True)
+        except httpx.TimeoutException as e:
+            raise HTTPException(504, f"file-server не ответил вовремя: {str(e)}")
+        except httpx.TransportError as e:
+            raise HTTPException(502, f"file-server недоступен: {str(e)}")
+        if response.status_code != 200:
+            await response.aclose()
+            raise HTTPException(404 if response.status_code == 404 else 502, "Файл не найден в хранилище")
+        return response
+
+    async def download(self, link: str):
+        """
+        Скачивает файл: небольшой остаётся в памяти, большой уходит во временный файл
+        :param link: хеш файла в file-server
+        :return: файловый объект, закрыть после использования
+        """
+        response = await self._open(link)
+        file = tempfile.SpooledTemporaryFile(max_size=FILE_SPOOL_SIZE)
+        try:
+            async for chunk in response.aiter_bytes():
+                await run_in_threadpool(file.write, chunk)
+        except Exception:
+            file.close()
+            raise
+        finally:
+            await response.aclose()
+        file.seek(0)
+        return file
+
+    async def stream(self, link: str, filename: str) -> StreamingResponse:
+        """
+        Отдаёт файл клиенту потоком, не сохраняя его на API-сервере
+        :param link:
+        :param filename:
+        :return:
+        """
+        response = await self._open(link)
+        return StreamingResponse(response.aiter_bytes(),
+                                 media_type=response.headers.get("content-type", "application/octet-stream"),
+                                 headers={"Content-Disposition": f"attachment; filename*=UTF-8''{quote(filename)}"},
+                                 background=BackgroundTask(response.aclose))
+
+
+file_storage = FileStorageClient()
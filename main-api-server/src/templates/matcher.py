@@ -0,0 +1,261 @@
+import asyncio
+import json
+import logging
+import os
+from array import array
+
+import numpy as np
+from redis.exceptions import RedisError
+from sqlalchemy import select, union_all
+
+from database.database import async_session
+from redis_creator.redis_creator import redis
+from src.resumes.models import Stack, Skill, ResumeData, InputResume
+from src.resumes.queue import REPLICA_ID
+from src.terms.service import term_dictionary
+
+logger = logging.getLogger(__name__)
+
+MATCHER_LOAD_BATCH = 10000
+# строки удалённых и пересобранных резюме вычищаются, когда их больше этой доли матрицы
+MATCHER_COMPACT_RATIO = 0.25
+MATCHER_COMPACT_MIN = 1024
+MATCHER_EVENTS_RECONNECT_DELAY = int(os.getenv("MATCHER_EVENTS_RECONNECT_DELAY", 5))
+
+
+def resumeTerms(resume: dict) -> list:
+    """
+    id терминов стека и навыков из сериализованного резюме.
+    Сначала по словарю: term_id в сохранённом документе мог устареть после слияния синонимов
+    """
+    items = [(stack.get('term_id'), stack['stack']) for stack in resume.get('stacks', [])] + \
+        [(skill.get('term_id'), skill['name']) for skill in resume.get('skills', [])]
+    return [term_dictionary.lookup(name) or term_id for term_id, name in items]
+
+
+class ResumeMatcher:
+    """
+    Разреженная матрица «резюме × термин словаря» в памяти.
+    На каждый id термина хранится постинг-лист — номера строк резюме, где он встречается.
+    Оценка шаблона по всем резюме — один np.bincount по постинг-листам его терминов.
+    Рядом хранятся владелец резюме — шаблон сравнивается только с резюме своего пользователя —
+    и стаж в месяцах, чтобы отсекать резюме с заведомо меньшим стажем, чем в шаблоне.
+    Матрица своя у каждой реплики, поэтому изменения рассылаются через pub/sub Redis
+    (publishAdd/publishRemove), а listen применяет изменения других реплик
+    """
+
+    channel = "matcher-events"
+
+    def __init__(self, redis_client=redis):
+        self.redis = redis_client
+        self.rows = {}
+        self.resume_ids = np.zeros(0, dtype=np.int64)
+        self.owners = np.zeros(0, dtype=np.int64)
+        self.alive = np.zeros(0, dtype=bool)
+        # -1 — стаж не распознан
+        self.experience = np.zeros(0, dtype=np.int32)
+        self.size = 0
+        self.dead = 0
+        self.postings = {}
+        self.loading = False
+        self.removed = set()
+
+    def _grow(self, capacity: int):
+        if capacity <= len(self.resume_ids):
+            return
+        capacity = max(capacity, len(self.resume_ids) * 2, 1024)
+        self.resume_ids = np.resize(self.resume_ids, capacity)
+        self.owners = np.resize(self.owners, capacity)
+        self.experience = np.resize(self.experience, capacity)
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:self.size] = self.alive[:self.size]
+        self.alive = alive
+
+    def _compact(self):
+        """
+        Убирает строки удалённых и заменённых резюме и перенумеровывает постинг-листы
+        :return:
+        """
+        alive = self.alive[:self.size]
+        remap = (np.cumsum(alive) - 1).astype(np.int32)
+        for term in list(self.postings):
+            rows = np.frombuffer(self.postings[term], dtype=np.int32)
+            rows = remap[rows[alive[rows]]]
+            if len(rows):
+                self.postings[term] = array("i", rows.tobytes())
+            else:
+                del self.postings[term]
+        self.resume_ids = self.resume_ids[:self.size][alive]
+        self.owners = self.owners[:self.size][alive]
+        self.experience = self.experience[:self.size][alive]
+        self.size = len(self.resume_ids)
+        self.alive = np.ones(self.size, dtype=bool)
+        self.rows = {int(resume_id): row for row, resume_id in enumerate(self.resume_ids)}
+        self.dead = 0
+
+    def add(self, resume_id: int, user_id: int, terms, experience_months: int = None):
+        """
+        Добавляет резюме или заменяет его термины
+        :param resume_id:
+        :param user_id: владелец резюме
+        :param terms: id терминов навыков и стека
+        :param experience_months: стаж в месяцах, если распознан
+        :return:
+        """
+        self.remove(resume_id)
+        terms = set(terms) - {None}
+        if not terms:
+            return
+        self._grow(self.size + 1)
+        row = self.size
+        self.size += 1
+        self.rows[resume_id] = row
+        self.resume_ids[row] = resume_id
+        self.owners[row] = -1 if user_id is None else user_id
+        self.experience[row] = -1 if experience_months is None else experience_months
+        self.alive[row] = True
+        for term in terms:
+            self.postings.setdefault(term, array("i")).append(row)
+
+    def remove(self, resume_id: int):
+        if self.loading:
+            self.removed.add(resume_id)
+        row = self.rows.pop(resume_id, None)
+        if row is not None:
+            self.alive[row] = False
+            self.dead += 1
+            if self.dead > max(MATCHER_COMPACT_MIN, self.size * MATCHER_COMPACT_RATIO):
+                self._compact()
+
+    def match(self, user_id: int, terms, limit: int, min_experience: int = None):
+        """
+        Лучшие резюме пользователя по доле терминов шаблона, которые в них есть
+        :param user_id:
+        :param terms: id терминов шаблона
+        :param limit:
+        :param min_experience: стаж из шаблона в месяцах; резюме с нераспознанным стажем не отсекаются
+        :return: [(resume_id, score)] по убыванию score
+        """
+        terms = set(terms) - {None}
+        if not terms or not self.rows:
+            return []
+        postings = [np.frombuffer(self.postings[term], dtype=np.int32) for term in terms if term in self.postings]
+        if not postings:
+            return []
+        hits = np.bincount(np.concatenate(postings), minlength=self.size)
+        scores = hits[:self.size] / len(terms)
+        scores[~self.alive[:self.size] | (self.owners[:self.size] != user_id)] = 0
+        if min_experience:
+            experience = self.experience[:self.size]
+            scores[(experience >= 0) & (experience < min_experience)] = 0
+        limit = min(limit, self.size)
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(self.resume_ids[row]), float(scores[row])) for row in top if scores[row] > 0]
+
+    async def publishAdd(self, resume_id: int, user_id: int, terms, experience_months: int = None):
+        """
+        Добавляет резюме в матрицу этой реплики и рассылает изменение остальным
+        :param resume_id:
+        :param user_id:
+        :param terms:
+        :param experience_months:
+        :return:
+        """
+        terms = sorted(set(terms) - {None})
+        self.add(resume_id, user_id, terms, experience_months)
+        await self._publish({"op": "add", "resume_id": resume_id, "user_id": user_id, "terms": terms,
+                             "experience_months": experience_months})
+
+    async def publishRemove(self, resume_id: int):
+        """
+        Убирает резюме из матрицы этой реплики и рассылает изменение остальным
+        :param resume_id:
+        :return:
+        """
+        self.remove(resume_id)
+        await self._publish({"op": "remove", "resume_id": resume_id})
+
+    async def _publish(self, event: dict):
+        try:
+            await self.redis.publish(self.channel, json.dumps({**event, "origin": REPLICA_ID}))
+        except RedisError:
+            logger.warning("Redis недоступен, изменение резюме %s в матрице навыков не разослано другим репликам",
+                           event["resume_id"])
+
+    def _apply(self, event: dict):
+        if event.get("origin") == REPLICA_ID:
+            return
+        if event["op"] == "add":
+            self.add(event["resume_id"], event["user_id"], event["terms"], event["experience_months"])
+        elif event["op"] == "remove":
+            self.remove(event["resume_id"])
+
+    async def listen(self):
+        """
+        Применяет изменения матрицы, разосланные другими репликами, при обрыве соединения переподключается
+        :return:
+        """
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.subscribe(self.channel)
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        self._apply(json.loads(message["data"]))
+            except RedisError:
+                logger.warning("Потеряна подписка на изменения матрицы навыков, переподключение через %s с",
+                               MATCHER_EVENTS_RECONNECT_DELAY)
+            finally:
+                await pubsub.close()
+            await asyncio.sleep(MATCHER_EVENTS_RECONNECT_DELAY)
+
+    async def load(self, batch_size: int = MATCHER_LOAD_BATCH):
+        """
+        Заполняет матрицу из БД пачками, вызывается в фоне на старте после бэкфилла term_id и стажа в месяцах:
+        записи без них в матрицу не попадут
+        :param batch_size:
+        :return:
+        """
+        terms, resumes = {}, {}
+        self.loading = True
+        try:
+            await self._load(terms, resumes, batch_size)
+        finally:
+            self.loading = False
+        for resume_id in sorted(terms):
+            if resume_id not in self.rows and resume_id not in self.removed:
+                user_id, experience_months = resumes[resume_id]
+                self.add(resume_id, user_id, terms[resume_id], experience_months)
+        self.removed.clear()
+        logger.info("Матрица навыков загружена: %s резюме, %s терминов", len(self.rows), len(self.postings))
+
+    async def _load(self, terms: dict, resumes: dict, batch_size: int):
+        last_id = 0
+        while True:
+            async with async_session() as db:
+                resume_ids = (await db.scalars(
+                    select(Stack.resume_id).where(Stack.resume_id > last_id, Stack.term_id.isnot(None))
+                    .union(select(Skill.resume_id).where(Skill.resume_id > last_id, Skill.term_id.isnot(None)))
+                    .order_by("resume_id").limit(batch_size))).all()
+                if not resume_ids:
+                    break
+                batch = (await db.execute(select(ResumeData.id, ResumeData.disabled, InputResume.user_id,
+                                                 ResumeData.experience_months)
+                                          .join(InputResume, InputResume.id == ResumeData.resume_id)
+                                          .where(ResumeData.id.in_(resume_ids)))).all()
+                low, high = resume_ids[0], resume_ids[-1]
+                rows = (await db.execute(union_all(
+                    select(Stack.resume_id, Stack.term_id).where(Stack.resume_id.between(low, high)),
+                    select(Skill.resume_id, Skill.term_id).where(Skill.resume_id.between(low, high))))).all()
+            for resume_id, is_disabled, user_id, experience_months in batch:
+                if not is_disabled:
+                    resumes[resume_id] = (user_id, experience_months)
+            for resume_id, term in rows:
+                if resume_id in resumes:
+                    terms.setdefault(resume_id, []).append(term)
+            last_id = high
+            await asyncio.sleep(0)
+
+
+resume_matcher = ResumeMatcher()
@@ -9,6 +9,7 @@ class TemplateSkills(AbstractModel):
     hidden = ["id"]
     template_id = Column(Integer, ForeignKey("templates.id"), index=True)
     name = Column(String)
+    term_id = Column(Integer, ForeignKey("terms.id"), index=True)
     template = relationship("Template", back_populates="skills", lazy="selectin")
 
 
@@ -18,6 +19,7 @@ class TemplateStacks(AbstractModel):
     template_id = Column(Integer, ForeignKey("templates.id"), index=True)
     name = Column(String)
     type = Column(String)
+    term_id = Column(Integer, ForeignKey("terms.id"), index=True)
 
     template = relationship("Template", back_populates="stacks", lazy="selectin")
 
@@ -1,11 +1,12 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from database.database import get_session
 from src.jwt_handler import verify_token_and_check_role_hiring_manager_and_recruiter, \
     verify_token_and_check_role_hiring_manager_and_resource_manager
 from src.templates.schemas import AddTemplate, BindTemplateParameters
-from src.templates.service import getMyTemplates, getById, addTemplate, allSkills, bindInTemplates
+from src.templates.service import getMyTemplates, getById, addTemplate, allSkills, bindInTemplates, \
+    matchTemplate
 
 templates_router = APIRouter(prefix="/templates")
 
@@ -23,6 +24,13 @@ async def get_by_id(template_id: int,
     return await getById(db, template_id, token['id'])
 
 
+@templates_router.get("/match", summary="Подбирает резюме под шаблон", tags=['Templates'])
+async def match_template(template_id: int, limit: int = Query(20, ge=1, le=100),
+                         token=Depends(verify_token_and_check_role_hiring_manager_and_resource_manager),
+                         db: AsyncSession = Depends(get_session)):
+    return await matchTemplate(db, template_id, token['id'], limit)
+
+
 @templates_router.post("/create", summary="Создает шаблон", tags=['Templates'])
 async def add_template(data: AddTemplate, token=Depends(verify_token_and_check_role_hiring_manager_and_resource_manager),
                     db: AsyncSession = Depends(get_session)):
@@ -4,7 +4,11 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.AbstractModel import query_fetchall, query_fetchone
 from src.exceptions import SuccessResponse
+from src.resumes.models import ResumeData, ResumeDocument, InputResume
+from src.resumes.service import fillResumeDocuments, projectResumeDocument
+from src.templates.matcher import resume_matcher
 from src.templates.models import Template, TemplateSkills, TemplateStacks
+from src.terms.service import term_dictionary
 from src.templates.schemas import AddTemplate
 
 
@@ -38,6 +42,35 @@ async def getById(db: AsyncSession, template_id: int, user_id: int):
     return SuccessResponse({"template": await template.to_dict(skills=True)})
 
 
+async def matchTemplate(db: AsyncSession, template_id: int, user_id: int, limit: int):
+    """
+    Лучшие резюме пользователя под шаблон по доле совпавших навыков и стека, без резюме со стажем меньше, чем в шаблоне.
+    Оценка считается по матрице в памяти (см. ResumeMatcher), из БД читаются только top-N
+    :param db:
+    :param template_id:
+    :param user_id:
+    :param limit:
+    :return:
+    """
+    template = await query_fetchone(db, select(Template)
+                                    .where(Template.user_id == user_id, Template.id == template_id)
+                                    .limit(1), False)
+    if template is False:
+        raise HTTPException(404, "Не найден шаблон. Либо он создан не этим пользователем")
+
+    terms = [row.term_id or term_dictionary.lookup(row.name) for row in template.skills + template.stacks]
+    scores = dict(resume_matcher.match(user_id, terms, limit, template.experience_month))
+    rows = (await db.execute(select(ResumeData.id, ResumeDocument.document)
+                             .join(InputResume, InputResume.id == ResumeData.resume_id)
+                             .outerjoin(ResumeDocument, ResumeDocument.resume_id == ResumeData.id)
+                             .where(ResumeData.id.in_(scores), InputResume.user_id == user_id,
+                                    ResumeData.disabled.is_(False)))).all() if scores else []
+    rows = sorted(rows, key=lambda row: scores[row[0]], reverse=True)
+    documents = await fillResumeDocuments(db, rows)
+    return SuccessResponse({"resumes": [{**projectResumeDocument(document, include=("stacks", "skills")),
+                                         "score": scores[document['id']]} for document in documents]})
+
+
 async def addTemplate(db: AsyncSession, user_id: int, data: AddTemplate):
     """
     Добавляет шаблон
@@ -72,8 +105,9 @@ async def addTemplateSkills(db: AsyncSession, template_id: int, skills: list):
     """
     result = []
     print(skills)
+    term_ids = await term_dictionary.resolve([skill['name'] for skill in skills])
     for skill in skills:
-        skill = TemplateSkills(template_id=template_id, name=skill['name'])
+        skill = TemplateSkills(template_id=template_id, name=skill['name'], term_id=term_ids.get(skill['name']))
         db.add(skill)
         result.append(result)
     await db.commit()
@@ -82,8 +116,10 @@ async def addTemplateSkills(db: AsyncSession, template_id: int, skills: list):
 
 async def addTemplateStacks(db: AsyncSession, template_id: int, stacks: list):
     result = []
+    term_ids = await term_dictionary.resolve([stack['name'] for stack in stacks])
     for stack in stacks:
-        stack = TemplateStacks(template_id=template_id, name=stack['name'], type=stack['type'])
+        stack = TemplateStacks(template_id=template_id, name=stack['name'], type=stack['type'],
+                               term_id=term_ids.get(stack['name']))
         db.add(stack)
         result.append(result)
     await db.commit()
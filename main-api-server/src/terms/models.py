@@ -0,0 +1,26 @@
+from sqlalchemy import Column, String, Integer, ForeignKey, UniqueConstraint
+
+from src.AbstractModel import AbstractModel
+
+
+class Term(AbstractModel):
+    __tablename__ = "terms"
+    # словарь навыков и стека: одна запись на все написания одного термина
+    __table_args__ = (
+        UniqueConstraint("key", name="uq_terms_key"),
+    )
+
+    name = Column(String, nullable=False)
+    # нормализованное написание, см. termKey
+    key = Column(String, nullable=False)
+
+
+class TermAlias(AbstractModel):
+    __tablename__ = "term_aliases"
+    # другие написания термина: python3 -> Python, k8s -> Kubernetes
+    __table_args__ = (
+        UniqueConstraint("alias", name="uq_term_aliases_alias"),
+    )
+
+    alias = Column(String, nullable=False)
+    term_id = Column(Integer, ForeignKey("terms.id"), nullable=False)
@@ -0,0 +1,200 @@
+import asyncio
+import logging
+import os
+
+from sqlalchemy import select, update, delete, func, exists
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from database.database import async_session
+from src.resumes.models import Stack, Skill
+from src.search.models import ResumeFacet, FacetCount
+from src.templates.models import TemplateStacks, TemplateSkills
+from src.terms.models import Term, TermAlias
+
+logger = logging.getLogger(__name__)
+
+TERMS_BACKFILL_BATCH = int(os.getenv("TERMS_BACKFILL_BATCH", 5000))
+# таблицы со ссылкой на словарь: модель и колонка с исходным названием
+TERM_COLUMNS = ((Stack, Stack.stack), (Skill, Skill.name),
+                (TemplateStacks, TemplateStacks.name), (TemplateSkills, TemplateSkills.name))
+# фасеты поиска, значения которых — канонические названия терминов
+TERM_FACETS = ("stack", "skill")
+# встроенные синонимы: написание -> каноническое название
+TERM_ALIASES = {
+    "python3": "Python",
+    "питон": "Python",
+    "js": "JavaScript",
+    "ts": "TypeScript",
+    "react": "ReactJS",
+    "react.js": "ReactJS",
+    "vue": "VueJS",
+    "vue.js": "VueJS",
+    "angularjs": "Angular",
+    "postgres": "PostgreSQL",
+    "postgre": "PostgreSQL",
+    "golang": "Go",
+    "k8s": "Kubernetes",
+    "csharp": "C#",
+    "c sharp": "C#",
+    "компас-3d": "КОМПАС3D",
+    "компас 3d": "КОМПАС3D",
+}
+
+
+def termKey(name: str) -> str:
+    """Нормализованное написание термина: регистр, пробелы и ё не различаются"""
+    return " ".join(name.lower().replace("ё", "е").split()) if name else ""
+
+
+class TermDictionary:
+    """
+    Словарь навыков и стека в памяти: нормализованное написание или синоним -> id термина.
+    При разборе резюме названия переводятся в id без запросов к БД,
+    в БД идут только термины, которых ещё нет в словаре
+    """
+
+    def __init__(self):
+        self.ids = {}
+        self.names = {}
+
+    def _remember(self, rows):
+        for term_id, key, name in rows:
+            self.ids.setdefault(key, term_id)
+            self.names[term_id] = name
+
+    def lookup(self, name: str):
+        """
+        id термина по названию, без обращения к БД
+        :param name:
+        :return: id или None, если термина нет в словаре
+        """
+        return self.ids.get(termKey(name))
+
+    def canonical(self, name: str) -> str:
+        """Каноническое название термина, для неизвестных — исходное без лишних пробелов"""
+        term_id = self.lookup(name)
+        return self.names[term_id] if term_id is not None else (name or "").strip()
+
+    async def resolve(self, names) -> dict:
+        """
+        id терминов по названиям, недостающие термины создаются в отдельной короткой транзакции
+        :param names:
+        :return: {название: id}, пустые названия пропускаются
+        """
+        missing = {}
+        for name in names:
+            key = termKey(name)
+            if key and key not in self.ids:
+                missing.setdefault(key, name.strip())
+        if missing:
+            await self._create(missing)
+        return {name: self.ids[termKey(name)] for name in names if termKey(name) in self.ids}
+
+    async def _create(self, missing: dict):
+        async with async_session() as db:
+            statement = pg_insert(Term).values([{"key": key, "name": name} for key, name in missing.items()])
+            await db.execute(statement.on_conflict_do_nothing(constraint="uq_terms_key"))
+            rows = (await db.execute(select(Term.id, Term.key, Term.name).where(Term.key.in_(missing)))).all()
+            await db.commit()
+        self._remember(rows)
+
+    async def load(self):
+        """
+        Заводит встроенные синонимы и загружает словарь целиком, вызывается на старте до приёма файлов
+        :return:
+        """
+        await self.resolve(list(TERM_ALIASES.values()))
+        await self._addAliases(TERM_ALIASES)
+        async with async_session() as db:
+            terms = (await db.execute(select(Term.id, Term.key, Term.name))).all()
+            aliases = (await db.execute(select(TermAlias.alias, TermAlias.term_id))).all()
+        self._remember(terms)
+        for alias, term_id in aliases:
+            self.ids[alias] = term_id
+        logger.info("Словарь терминов загружен: %s терминов, %s синонимов", len(terms), len(aliases))
+
+    async def _addAliases(self, aliases: dict):
+        """
+        Записывает синонимы. Если синоним уже успел стать отдельным термином,
+        ссылки на него и фасеты с его названием переводятся на канонический термин
+        :param aliases: {написание: каноническое название}
+        :return:
+        """
+        values = {termKey(alias): self.lookup(name) for alias, name in aliases.items()}
+        async with async_session() as db:
+            await db.execute(pg_insert(TermAlias).values([{"alias": alias, "term_id": term_id}
+                                                          for alias, term_id in values.items()])
+                             .on_conflict_do_nothing(constraint="uq_term_aliases_alias"))
+            merged = (await db.execute(select(Term.id, Term.key, Term.name).where(Term.key.in_(values)))).all()
+            for old_id, key, old_name in merged:
+                if old_id == values[key]:
+                    continue
+                for model, _ in TERM_COLUMNS:
+                    await db.execute(update(model).where(model.term_id == old_id).values(term_id=values[key]))
+                await mergeTermFacets(db, old_name, self.names[values[key]])
+            await db.commit()
+        for alias, term_id in values.items():
+            self.ids[alias] = term_id
+
+
+async def mergeTermFacets(db: AsyncSession, old_name: str, name: str):
+    """
+    Переносит фасеты стека и навыков со старого названия термина на каноническое и пересчитывает
+    счётчики обоих значений по resume_facets: резюме, где были оба написания, считается один раз.
+    Без commit
+    :param db:
+    :param old_name:
+    :param name: каноническое название
+    :return:
+    """
+    if old_name == name:
+        return
+    term_facets = ResumeFacet.facet.in_(TERM_FACETS)
+    same = aliased(ResumeFacet)
+    await db.execute(delete(ResumeFacet)
+                     .where(term_facets, ResumeFacet.value == old_name,
+                            exists().where(same.resume_id == ResumeFacet.resume_id, same.facet == ResumeFacet.facet,
+                                           same.value == name)))
+    await db.execute(update(ResumeFacet).where(term_facets, ResumeFacet.value == old_name).values(value=name))
+    await db.execute(delete(FacetCount).where(FacetCount.facet.in_(TERM_FACETS), FacetCount.value == old_name))
+    statement = pg_insert(FacetCount).from_select(
+        ["user_id", "facet", "value", "count"],
+        select(ResumeFacet.user_id, ResumeFacet.facet, ResumeFacet.value, func.count())
+        .where(term_facets, ResumeFacet.value == name)
+        .group_by(ResumeFacet.user_id, ResumeFacet.facet, ResumeFacet.value))
+    await db.execute(statement.on_conflict_do_update(constraint="uq_facet_counts_user_facet_value",
+                                                     set_={"count": statement.excluded.count}))
+
+
+async def backfillTermIds(batch_size: int = TERMS_BACKFILL_BATCH):
+    """
+    Проставляет term_id записям стека, навыков и шаблонов, сохранённым до появления словаря
+    :param batch_size:
+    :return: сколько записей обновлено
+    """
+    total = 0
+    for model, column in TERM_COLUMNS:
+        last_id = 0
+        while True:
+            async with async_session() as db:
+                rows = (await db.execute(select(model.id, column)
+                                         .where(model.id > last_id, model.term_id.is_(None))
+                                         .order_by(model.id).limit(batch_size))).all()
+                if not rows:
+                    break
+                term_ids = await term_dictionary.resolve([name for _, name in rows])
+                values = [{"id": row_id, "term_id": term_ids[name]} for row_id, name in rows if name in term_ids]
+                if values:
+                    await db.execute(update(model), values)
+                    await db.commit()
+                last_id = rows[-1][0]
+                total += len(values)
+            await asyncio.sleep(0)
+    if total:
+        logger.info("term_id проставлен для %s записей", total)
+    return total
+
+
+term_dictionary = TermDictionary()
@@ -0,0 +1,22 @@
+import pytest
+from fastapi import HTTPException
+
+from src.pagination import encode_cursor, decode_cursor
+
+
+@pytest.mark.parametrize("values", [
+    {"id": 42},
+    {"experience": 27, "id": 7},
+    {"experience": None, "id": 1},
+])
+def test_cursor_roundtrip(values):
+    cursor = encode_cursor(**values)
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == values
+
+
+@pytest.mark.parametrize("cursor", ["не курсор", "bm90IGpzb24", "WzEsMl0", "%%%"])
+def test_bad_cursor(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor)
+    assert error.value.status_code == 400
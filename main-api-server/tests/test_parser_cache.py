@@ -0,0 +1,64 @@
+import asyncio
+
+from redis.exceptions import RedisError
+
+from src.parser import cache as cache_module
+from src.parser.cache import ParserCache
+
+
+class DictRedis:
+    """Redis на словаре: только get/set, которые зовёт ParserCache"""
+
+    def __init__(self):
+        self.values = {}
+
+    async def get(self, key):
+        return self.values.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.values[key] = value.encode()
+
+
+class DownRedis:
+    async def get(self, key):
+        raise RedisError()
+
+    async def set(self, key, value, ex=None):
+        raise RedisError()
+
+
+def test_memory_and_redis_levels():
+    redis = DictRedis()
+    cache = ParserCache(redis, max_size=10)
+    assert asyncio.run(cache.get("a")) is None
+    asyncio.run(cache.set("a", {"name": "Иван"}))
+    assert asyncio.run(cache.get("a")) == {"name": "Иван"}
+
+    other = ParserCache(redis, max_size=10)
+    assert asyncio.run(other.get("a")) == {"name": "Иван"}
+    assert asyncio.run(other.get("a")) == {"name": "Иван"}
+    assert other.stats() == {"memory_hits": 1, "redis_hits": 1, "misses": 0, "hit_rate": 1.0, "memory_size": 1}
+    assert cache.stats()["misses"] == 1
+
+
+def test_lru_eviction():
+    cache = ParserCache(DownRedis(), max_size=2)
+    asyncio.run(cache.set("a", {"v": 1}))
+    asyncio.run(cache.set("b", {"v": 2}))
+    # a становится последним использованным, вытесняется b
+    assert asyncio.run(cache.get("a")) == {"v": 1}
+    asyncio.run(cache.set("c", {"v": 3}))
+    assert list(cache.local) == ["a", "c"]
+    assert asyncio.run(cache.get("b")) is None
+
+
+def test_memory_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, "monotonic", lambda: now[0])
+    cache = ParserCache(DownRedis(), max_size=10, ttl=60)
+    asyncio.run(cache.set("a", {"v": 1}))
+    now[0] += 59
+    assert asyncio.run(cache.get("a")) == {"v": 1}
+    now[0] += 2
+    assert asyncio.run(cache.get("a")) is None
+    assert "a" not in cache.local
@@ -0,0 +1,66 @@
+import hashlib
+import random
+
+FIRST_NAMES = ["Иван", "Алексей", "Дмитрий", "Сергей", "Андрей", "Мария", "Анна", "Елена", "Ольга", "Наталья",
+               "Павел", "Артём", "Никита", "Екатерина", "Татьяна"]
+LAST_NAMES = ["Петров", "Иванов", "Смирнов", "Кузнецов", "Попов", "Васильев", "Соколов", "Михайлов", "Новиков",
+              "Фёдоров", "Морозов", "Волков", "Алексеев", "Лебедев", "Семёнов"]
+MIDDLE_NAMES = ["Иванович", "Петрович", "Сергеевич", "Андреевич", "Дмитриевич", "Алексеевич", None]
+DOMAINS = ["mail.ru", "yandex.ru", "gmail.com", "bk.ru", "inbox.ru"]
+DEGREES = ["junior", "middle", "senior", "lead"]
+POSITIONS = ["Python developer", "Java developer", "Frontend developer", "Fullstack developer", "DevOps engineer",
+             "Аналитик", "QA engineer", "Инженер-конструктор", "Data scientist", "Team lead"]
+STACKS = ["Python", "FastAPI", "Django", "PostgreSQL", "Redis", "Docker", "Kubernetes", "Java", "Spring", "Kotlin",
+          "ReactJS", "VueJS", "Angular", "TypeScript", "PHP", "C#", "Go", "КОМПАС3D", "Linux", "Git"]
+SOFT_SKILLS = ["Коммуникабельность", "Ответственность", "Обучаемость", "Работа в команде", "Стрессоустойчивость"]
+HARD_SKILLS = ["Проектирование API", "Оптимизация SQL", "Code review", "CI/CD", "Нагрузочное тестирование"]
+COMPANIES = ["ООО Ромашка", "Яндекс", "Сбер", "Тинькофф", "ACME", "Севастопольский морской завод", "VK", "Ozon"]
+CITIES = ["Севастополь", "Симферополь", "Москва", "Санкт-Петербург", "Краснодар", "удалённо"]
+TRANSLIT = str.maketrans({"а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ё": "e", "ж": "zh", "з": "z",
+                          "и": "i", "й": "y", "к": "k", "л": "l", "м": "m", "н": "n", "о": "o", "п": "p", "р": "r",
+                          "с": "s", "т": "t", "у": "u", "ф": "f", "х": "h", "ц": "ts", "ч": "ch", "ш": "sh",
+                          "щ": "sch", "ъ": "", "ы": "y", "ь": "", "э": "e", "ю": "yu", "я": "ya"})
+ACHIEVEMENTS = ["Ускорил ключевой сервис в 3 раза", "Перевёл монолит на микросервисы", "Внедрил CI/CD",
+                "Сократил время сборки вдвое", "Наставник для двух стажёров"]
+
+
+def months(total: int) -> str:
+    years, rest = divmod(total, 12)
+    return f"{years} лет {rest} месяцев" if years else f"{rest} месяцев"
+
+
+def generateAnswer(content: bytes) -> dict:
+    """
+    Ответ в формате парсера резюме. Одинаковый файл даёт одинаковый ответ, разные — разных кандидатов
+    :param content:
+    :return:
+    """
+    rng = random.Random(hashlib.sha256(content).digest())
+    first_name, last_name = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+    age = rng.randint(20, 60)
+    birth_year = 2024 - age
+    login = f"{first_name[0]}.{last_name}{rng.randint(1, 999)}".lower().translate(TRANSLIT)
+    jobs = []
+    year = birth_year + 21
+    for _ in range(rng.randint(1, 4)):
+        end = min(year + rng.randint(1, 5), 2024)
+        jobs.append({"job_company": rng.choice(COMPANIES), "start_date": f"{year}-{rng.randint(1, 12):02d}",
+                     "end_date": f"{end}-{rng.randint(1, 12):02d}",
+                     "job_description": f"{rng.choice(POSITIONS)}: " + ", ".join(rng.sample(STACKS, 3)),
+                     "job_location": rng.choice(CITIES)})
+        year = end
+    experience = sum(int(job["end_date"][:4]) - int(job["start_date"][:4]) for job in jobs) * 12 + rng.randint(0, 11)
+    return {
+        "person": {"first_name": first_name, "last_name": last_name, "middle_name": rng.choice(MIDDLE_NAMES),
+                   "age": age, "birth_date": f"{birth_year}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"},
+        "contact": {"email": f"{login}@{rng.choice(DOMAINS)}",
+                    "phone_number": f"+7 (978) {rng.randint(100, 999)}-{rng.randint(10, 99)}-{rng.randint(10, 99)}",
+                    "telegram": "@" + login.replace(".", "_")},
+        "hh-url": f"https://hh.ru/resume/{rng.getrandbits(64):016x}" if rng.random() < 0.5 else None,
+        "stats": {"degree": rng.choice(DEGREES), "experience": months(experience), "position": rng.choice(POSITIONS)},
+        "jobs": jobs,
+        "stack": [{"stack": stack} for stack in rng.sample(STACKS, rng.randint(2, 8))],
+        "skills": [{"name": name, "type": "soft"} for name in rng.sample(SOFT_SKILLS, rng.randint(1, 3))] +
+                  [{"name": name, "type": "hard"} for name in rng.sample(HARD_SKILLS, rng.randint(0, 3))],
+        "achievements": [{"description": text} for text in rng.sample(ACHIEVEMENTS, rng.randint(0, 3))],
+    }
@@ -0,0 +1,33 @@
+import asyncio
+import os
+import random
+
+import uvicorn
+from fastapi import FastAPI, UploadFile, File
+from starlette.responses import JSONResponse
+
+from generator import generateAnswer
+
+# средняя задержка ответа и её разброс в секундах
+PARSER_STUB_LATENCY = float(os.getenv("PARSER_STUB_LATENCY", 1.5))
+PARSER_STUB_JITTER = float(os.getenv("PARSER_STUB_JITTER", 0.5))
+# доля ответов 500 и доля документов, которые «не удалось разобрать»
+PARSER_STUB_ERROR_RATE = float(os.getenv("PARSER_STUB_ERROR_RATE", 0.02))
+PARSER_STUB_REJECT_RATE = float(os.getenv("PARSER_STUB_REJECT_RATE", 0.03))
+
+app = FastAPI(title="ParserStub", description="Заглушка парсера резюме для локальной разработки и бенчмарков")
+
+
+@app.post("/resume/scrab")
+async def scrab(file: UploadFile = File(...)):
+    content = await file.read()
+    await asyncio.sleep(max(0.0, random.gauss(PARSER_STUB_LATENCY, PARSER_STUB_JITTER)))
+    if random.random() < PARSER_STUB_ERROR_RATE:
+        return JSONResponse({"detail": "Internal parser error"}, status_code=500)
+    if random.random() < PARSER_STUB_REJECT_RATE:
+        return {"result": "Не удалось разобрать документ"}
+    return generateAnswer(content)
+
+
+if __name__ == "__main__":
+    uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("PORT", 8080)))